@@ -0,0 +1,62 @@
+"""Memory of retained messages: plain dicts from json vs wetchgram models.
+
+    python benchmarks/models_memory.py [count]
+"""
+import gc
+import json
+import sys
+import tracemalloc
+
+sys.path.insert(0, ".")
+
+from wetchgram.models import Message  # noqa: E402
+
+
+def make_update(i: int) -> dict:
+    return {
+        "update_id": i,
+        "message": {
+            "message_id": i,
+            "from": {"id": 1000 + i % 5000, "is_bot": False, "first_name": "User", "username": f"user{i % 5000}",
+                     "language_code": "en"},
+            "chat": {"id": -100123456, "title": "Moderated group", "type": "supergroup"},
+            "date": 1700000000 + i,
+            "text": f"message number {i} with a link https://example.com",
+            "entities": [{"offset": 25, "length": 19, "type": "url"}]
+        }
+    }
+
+
+def measure(count: int, build) -> int:
+    # Each update is decoded from its own JSON, as getUpdates responses are
+    payloads = [json.dumps(make_update(i)) for i in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    kept = [build(json.loads(payload)["message"]) for payload in payloads]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    cases = [
+        ("dict", lambda m: m),
+        ("Message", Message),
+        ("Message, chat/from read", lambda m: _touch(Message(m))),
+    ]
+    baseline = None
+    for name, build in cases:
+        size = measure(count, build)
+        baseline = baseline or size
+        print(f"{name:<26} {size / count:7.0f} B/message  {size / baseline:5.0%}")
+
+
+def _touch(message: Message) -> Message:
+    message.chat, message.from_user
+    return message
+
+
+if __name__ == "__main__":
+    main()
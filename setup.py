@@ -10,6 +10,10 @@ setup(
     install_requires=[
         "requests",
     ],
+    extras_require={
+        "async": ["aiohttp"],
+        "fast": ["orjson"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",
@@ -1,4 +1,6 @@
 from .bot import Bot
+from .async_bot import AsyncBot
+from .models import Update, Message, User, Chat, CallbackQuery
 from .types import (
     ReplyKeyboardMarkup,
     ReplyKeyboardButton,
@@ -10,6 +12,12 @@ from .types import (
 
 __all__ = [
     'Bot',
+    'AsyncBot',
+    'Update',
+    'Message',
+    'User',
+    'Chat',
+    'CallbackQuery',
     'ReplyKeyboardMarkup',
     'ReplyKeyboardButton',
     'InlineKeyboardButton',
@@ -0,0 +1,438 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Union
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from . import bot as _bot
+from .bot import Bot, _describe, _stale_file_id, _upload_timeout
+from .broadcast import Broadcast
+from .dispatcher import AsyncDispatcher
+from .download import AsyncDownloader
+from .multipart import MultipartEncoder
+from .webhook import WebhookServer
+
+
+class AsyncBot(Bot):
+    """asyncio flavour of Bot.
+
+    Every Bot method returns an awaitable here, so the whole method surface
+    is shared: ``await bot.send_message(chat_id, "hi")``. Polling and
+    dispatch run on one event loop; ``async def`` handlers are awaited on
+    it and plain handlers run on the thread pool, where API calls block
+    on the loop and return the result as in Bot. Updates go through an
+    AsyncDispatcher with the same options as Bot's Dispatcher: per-chat
+    order, ``workers`` handlers at a time, ``max_pending``, shedding and
+    priority lanes.
+    """
+
+    def __init__(self,
+                 token: str,
+                 workers: int = 4,
+                 pool_size: Optional[int] = 100,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0,
+                 shards: int = 64,
+                 max_queue_per_key: int = 1000,
+                 max_pending: int = 10000,
+                 shed_policy: Optional[Dict[str, float]] = None,
+                 lanes: Optional[Dict[str, Sequence[str]]] = None,
+                 reserved_workers: Optional[Dict[str, int]] = None):
+        if aiohttp is None:
+            raise ImportError("AsyncBot requires aiohttp: pip install wetchgram[async]")
+        super().__init__(token, workers, pool_size, connect_timeout, read_timeout, shards,
+                         max_queue_per_key, max_pending, shed_policy, lanes, reserved_workers)
+        self.dispatcher = AsyncDispatcher(self._handle_update, workers, shards, max_queue_per_key,
+                                          max_pending, shed_policy, self._update_done,
+                                          lanes, reserved_workers)
+        # Plain handlers run here, off the loop
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._loop = None
+        self._tasks = set()
+
+    def runing(self, limit: int = 100, timeout: int = 20, max_backoff: float = 30.0):
+        asyncio.run(self.polling(limit, timeout, max_backoff))
+
+    async def polling(self, limit: int = 100, timeout: int = 20, max_backoff: float = 30.0):
+        os.system("clear")
+        print("[!] Warn: token checking...")
+
+        if not await self._validate_token():
+            print("[!] Token failed validation")
+            return
+
+        await asyncio.sleep(1.1)
+        os.system("clear")
+        print("All processes are launched\nWetchgram working (@2025)")
+
+        self._loop = asyncio.get_running_loop()
+        self.dispatcher.start()
+        await self._replay_pending()
+        offset = 0
+        poll_timeout = 0
+        backoff = 0.0
+        try:
+            while True:
+                try:
+                    if self.offsets is not None:
+                        # Saving the journal fsyncs, keep it off the loop
+                        offset = await self._loop.run_in_executor(None, self.offsets.poll_offset)
+                    updates = await self._get_updates(offset, limit, poll_timeout)
+                    if updates is None:
+                        raise ConnectionError("getUpdates failed")
+                    backoff = 0.0
+                    fresh = 0
+                    for update in updates:
+                        offset = update["update_id"] + 1
+                        if self.offsets is None or self.offsets.begin(update):
+                            fresh += 1
+                            await self._dispatch(update)
+                    poll_timeout = 0 if len(updates) >= limit else timeout
+                    if self.offsets is not None:
+                        self.offsets.commit()
+                        if updates and not fresh:
+                            # Only redeliveries: the journal could not be saved
+                            await asyncio.sleep(1.0)
+                except Exception as e:
+                    backoff = min(max_backoff, backoff * 2 or 0.5)
+                    print(f"Error: {e}, retrying in {backoff:.1f}s")
+                    await asyncio.sleep(backoff)
+        finally:
+            self.dispatcher.stop()
+            if self.offsets is not None:
+                self.offsets.commit(force=True)
+            await self.close()
+
+    def run_webhook(self,
+                    host: str = "0.0.0.0",
+                    port: int = 8443,
+                    path: str = "/webhook",
+                    secret_token: Optional[str] = None,
+                    url: Optional[str] = None,
+                    max_connections: int = 40,
+                    certfile: Optional[str] = None,
+                    keyfile: Optional[str] = None):
+        asyncio.run(self.serve_webhook(host, port, path, secret_token, url,
+                                       max_connections, certfile, keyfile))
+
+    async def serve_webhook(self,
+                            host: str = "0.0.0.0",
+                            port: int = 8443,
+                            path: str = "/webhook",
+                            secret_token: Optional[str] = None,
+                            url: Optional[str] = None,
+                            max_connections: int = 40,
+                            certfile: Optional[str] = None,
+                            keyfile: Optional[str] = None):
+        if not await self._validate_token():
+            print("[!] Token failed validation")
+            return
+
+        self._loop = asyncio.get_running_loop()
+        if url:
+            await self.set_webhook(url, max_connections=max_connections, secret_token=secret_token)
+
+        server = WebhookServer(host, port, path, self._submit_update,
+                               secret_token=secret_token, certfile=certfile, keyfile=keyfile,
+                               loads=self.codec.loads)
+        self.dispatcher.start()
+        await self._replay_pending()
+        print(f"Wetchgram webhook listening on {host}:{port}{path}")
+        try:
+            await self._loop.run_in_executor(None, server.serve_forever)
+        finally:
+            self.dispatcher.stop()
+            server.shutdown()
+            server.server_close()
+            await self.close()
+
+    def _submit_update(self, update: dict) -> bool:
+        # Called from the webhook server threads
+        if self.offsets is not None and not self.offsets.begin(update):
+            return False
+        # Blocks the request while the queue is full, as Bot does
+        asyncio.run_coroutine_threadsafe(self._dispatch(update), self._loop).result()
+        return True
+
+    async def _replay_pending(self):
+        if self.offsets is None:
+            return
+        for update in self.offsets.replay():
+            await self._dispatch(update)
+
+    async def _dispatch(self, update: dict):
+        # Pauses polling/webhook intake while the queue is full
+        await self.dispatcher.wait_for_capacity()
+        if not self.dispatcher.submit(update):
+            self._update_done(update)
+
+    def enable_processes(self, processes: int = 4, max_pending: int = 10000):
+        raise NotImplementedError("AsyncBot handles updates on its event loop, use Bot.enable_processes()")
+
+    def _handlers_changed(self):
+        result = super()._handlers_changed()
+        if asyncio.iscoroutine(result):
+            # Handler registered on the loop, set_webhook runs in the background
+            self._spawn(result)
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _validate_token(self) -> bool:
+        """Validate bot token"""
+        response = await self._request("getMe")
+        if response.get("ok"):
+            self.username = response["result"].get("username")
+        return response.get("ok", False)
+
+    async def _get_updates(self, offset: int, limit: int = 100, timeout: int = 20) -> Optional[list]:
+        data = {"offset": offset, "timeout": timeout, "limit": limit,
+                "allowed_updates": self.derive_allowed_updates()}
+        response = await self._request("getUpdates", data, timeout=timeout + 10)
+        if not response.get("ok"):
+            return None
+        return response.get("result", [])
+
+    async def _handle_update(self, update: dict):
+        if self.lookup_cache is not None:
+            self.lookup_cache.observe_update(update)
+        try:
+            match = self._match_update(update)
+            if match is None:
+                return
+            handler, payload, args = match
+            if asyncio.iscoroutinefunction(handler):
+                await handler(payload, *args)
+            else:
+                await asyncio.get_running_loop().run_in_executor(self.executor, handler, payload, *args)
+        except Exception as e:
+            print(f"Handler error: {e}")
+
+    # ==============================
+    # HTTP Session
+    # ==============================
+    def _create_session(self):
+        # aiohttp sessions must be created inside the running loop
+        return None
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            headers = {"User-Agent": self.user_agent} if self.user_agent else None
+            self.session = aiohttp.ClientSession(connector=connector, headers=headers)
+        return self.session
+
+    def set_user_agent(self, user_agent: str):
+        """Set custom User-Agent for requests"""
+        self.user_agent = user_agent
+        if self.session is not None:
+            self.session.headers["User-Agent"] = user_agent
+
+    def _request(self,
+                 method: str,
+                 data: Optional[dict] = None,
+                 files: Optional[dict] = None,
+                 timeout: Optional[float] = None):
+        return self._bridge(self._async_request(method, data, files, timeout))
+
+    def _bridge(self, coro):
+        """Return coro to await, or run it on the bot loop from a sync handler thread"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            if self._loop is not None and self._loop.is_running():
+                return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+        return coro
+
+    def _offload(self, func):
+        """Run blocking func that makes bot calls from its own threads.
+
+        On the loop it returns an awaitable running func on the default
+        executor, so the loop stays free to serve those calls; from a sync
+        handler thread func simply runs.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            if self._loop is not None and self._loop.is_running():
+                return func()
+        return self._run_in_thread(func)
+
+    async def _run_in_thread(self, func):
+        loop = asyncio.get_running_loop()
+        if self._loop is None or not self._loop.is_running():
+            # Outside polling: this loop serves the calls func makes
+            self._loop = loop
+        return await loop.run_in_executor(None, func)
+
+    def broadcast(self,
+                  chat_ids: Iterable[Any],
+                  payload: Dict[str, Any],
+                  checkpoint: Optional[str] = None,
+                  concurrency: int = 25,
+                  rate: float = 25,
+                  progress: Optional[Callable[[dict], None]] = None):
+        """Awaitable on the loop: ``stats = await bot.broadcast(...)``"""
+        return self._offload(Broadcast(self, chat_ids, payload, checkpoint, concurrency, rate, progress).run)
+
+    def download_many(self, files: Iterable[Union[str, dict]], dest_dir: str, concurrency: int = 8):
+        """On the loop an async iterator: ``async for result in bot.download_many(...)``"""
+        results = super().download_many(files, dest_dir, concurrency)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            if self._loop is not None and self._loop.is_running():
+                return results
+        return self._iterate_in_thread(results)
+
+    async def _iterate_in_thread(self, iterator):
+        # Each next() blocks until a download completes, so it runs off the loop
+        loop = asyncio.get_running_loop()
+        if self._loop is None or not self._loop.is_running():
+            self._loop = loop
+        done = object()
+        while True:
+            item = await loop.run_in_executor(None, next, iterator, done)
+            if item is done:
+                return
+            yield item
+
+    async def _async_request(self,
+                             method: str,
+                             data: Optional[dict] = None,
+                             files: Optional[dict] = None,
+                             timeout: Optional[float] = None) -> dict:
+        if self.lookup_cache is not None:
+            key = self.lookup_cache.key(method, data)
+            if key is not None:
+                return await self.lookup_cache.fetch_async(key, partial(self._async_call, method, data, files, timeout))
+        if not files or self.file_cache is None:
+            result = await self._async_call(method, data, files, timeout)
+            if self.lookup_cache is not None:
+                self.lookup_cache.after_call(method, data, result)
+            return result
+
+        cached_data, upload, used, uploads = self.file_cache.prepare(data, files)
+        result = await self._async_call(method, cached_data, upload, timeout)
+        if used and _stale_file_id(result):
+            for key in used.values():
+                self.file_cache.invalidate(key)
+            cached_data, upload, used, uploads = self.file_cache.prepare(data, files, use_cache=False)
+            result = await self._async_call(method, cached_data, upload, timeout)
+        self.file_cache.remember(uploads, result)
+        return result
+
+    async def _async_call(self,
+                          method: str,
+                          data: Optional[dict] = None,
+                          files: Optional[dict] = None,
+                          timeout: Optional[float] = None) -> dict:
+        url = f"{_bot.API_URL}/bot{self.token}/{method}"
+        timeout = timeout or self.read_timeout
+        chat_id = data.get("chat_id") if data else None
+        progress = partial(self.upload_progress, method) if files and self.upload_progress else None
+        try:
+            body = self._body(data, files, progress)
+        except (OSError, TypeError, ValueError) as e:
+            # Missing upload, unserializable field: no attempt can succeed
+            print(f"{_describe(method)} error: {e}")
+            return {}
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            flood = self.retry_policy.flood_delay(chat_id)
+            if flood > 0:
+                await asyncio.sleep(flood)
+            await self._check_rate_limit_async(method, data)
+
+            status, result, error = None, None, None
+            try:
+                status, result = await self._post(url, body, timeout)
+            except Exception as e:
+                error = e
+
+            delay = self.retry_policy.retry_delay(method, chat_id, attempt, started, status, result, error)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        if result is None:
+            print(f"{_describe(method)} error: {error}")
+            return {}
+        return result
+
+    async def _post(self, url: str, body, timeout: float):
+        if not isinstance(body, MultipartEncoder):
+            request = self._get_session().post(url, data=body, headers=_bot.JSON_HEADERS if body else None,
+                                               timeout=self._timeout(timeout))
+        else:
+            body.rewind()
+            headers = {"Content-Type": body.content_type}
+            if body.total is not None:
+                headers["Content-Length"] = str(body.total)
+            request = self._get_session().post(url,
+                                               data=_aiter(body.chunks()),
+                                               headers=headers,
+                                               timeout=self._timeout(_upload_timeout(timeout, body.total)))
+        async with request as response:
+            return response.status, self.codec.loads(await response.read())
+
+    def _timeout(self, read_timeout: float):
+        return aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=read_timeout)
+
+    async def _check_rate_limit_async(self, method: str, data: Optional[dict] = None):
+        limiter = self.rate_limiter
+        if limiter is None:
+            return
+        delay = limiter.reserve_chat(method, data.get("chat_id") if data else None)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        delay = limiter.reserve_global(method)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def download_file(self,
+                      file_path: str,
+                      destination: Any = None,
+                      expected_size: Optional[int] = None,
+                      chunk_size: int = 256 * 1024,
+                      segments: int = 4):
+        return self._bridge(self._download_file(file_path, destination, expected_size, chunk_size, segments))
+
+    async def _download_file(self,
+                             file_path: str,
+                             destination: Any,
+                             expected_size: Optional[int],
+                             chunk_size: int,
+                             segments: int) -> Union[bool, bytes, None]:
+        url = f"{_bot.API_URL}/file/bot{self.token}/{file_path}"
+        downloader = AsyncDownloader(self._get_session(), self._timeout(self.read_timeout), chunk_size, segments)
+        target = bytearray() if destination is None else destination
+        try:
+            await downloader.download(url, target, expected_size)
+        except Exception as e:
+            print(f"Download file error: {e}")
+            return None if destination is None else False
+        return bytes(target) if destination is None else True
+
+    async def close(self):
+        """Close HTTP session and handler thread pool"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.executor.shutdown(wait=False)
+
+
+async def _aiter(chunks):
+    # File sources are read in small chunks, short blocking reads are fine on the loop
+    for chunk in chunks:
+        yield chunk
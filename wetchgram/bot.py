@@ -1,31 +1,223 @@
 import requests
+import re
 import time
 import os
+from functools import partial
 from threading import Thread
 from concurrent.futures import ThreadPoolExecutor
-from typing import Union, List, Dict, Optional, Any
+from typing import Union, List, Dict, Optional, Any, Pattern, Iterable, Iterator, Callable, Sequence
+from requests.adapters import HTTPAdapter
+from .broadcast import Broadcast
+from .cache import LookupCache
+from .codec import JsonCodec, get_codec
+from .coalesce import EditCoalescer
+from .dispatcher import MESSAGE_UPDATES, Dispatcher, content_type, update_type
+from .download import Downloader, download_many
+from .filecache import FileIdCache
+from .models import UPDATE_MODELS, CallbackQuery, Message
+from .offsets import FileOffsetStore, OffsetStore, OffsetTracker, SQLiteOffsetStore
+from .multipart import MultipartEncoder
+from .offload import CpuBoundHandler, CpuPool
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy
+from .router import Router, split_command
+from .supervisor import Supervisor
+from .webhook import WebhookServer
+
+API_URL = "https://api.telegram.org"
+# Bytes per second assumed when sizing upload timeouts
+UPLOAD_RATE = 1024 * 1024
+JSON_HEADERS = {"Content-Type": "application/json"}
+# Kept-alive connections for broadcast() and download_many() at their default concurrency
+BULK_CONNECTIONS = 25 + 8
+
 
 class Bot:
-    def __init__(self, token: str, workers: int = 4):
+    def __init__(self,
+                 token: str,
+                 workers: int = 4,
+                 pool_size: Optional[int] = None,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0,
+                 shards: int = 64,
+                 max_queue_per_key: int = 1000,
+                 max_pending: int = 10000,
+                 shed_policy: Optional[Dict[str, float]] = None,
+                 lanes: Optional[Dict[str, Sequence[str]]] = None,
+                 reserved_workers: Optional[Dict[str, int]] = None):
         self.token = token
-        self.routes = {}
-        self.callbacks = {}
-        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.routes = Router()
+        # Update type, or (update type, content type) for messages -> (handler, False, model)
+        self.handlers = {}
+        self._matchers = {"message": self._match_message, "callback_query": self._match_callback}
+        self.callbacks = Router()
+        self.username = None
+        self.dispatcher = Dispatcher(self._handle_update, workers, shards, max_queue_per_key,
+                                     max_pending, shed_policy, self._update_done,
+                                     lanes, reserved_workers)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.user_agent = None
+        # One connection per worker, the polling loop, bulk sends and downloads.
+        # Sized once: remounting adapters later would race requests in flight
+        self.pool_size = pool_size or workers + sum((reserved_workers or {}).values()) + 2 + BULK_CONNECTIONS
+        self.session = self._create_session()
+        self.rate_limiter = None
+        self.retry_policy = RetryPolicy()
+        self.codec = get_codec()
+        self.edits = None
+        self.file_cache = None
+        self.lookup_cache = None
+        self.offsets = None
+        self.allowed_updates = None
+        self._webhook = None
+        self.cpu_pool = None
+        self.upload_progress = None
+        self.download_pool = None
+        self._download_workers = 0
         print("Hello, wetchgram - tools tg bot.")
 
-    def function(self, command: str):
+    def function(self,
+                 command: Union[str, Pattern],
+                 prefix: bool = False,
+                 typed: bool = False,
+                 cpu_bound: bool = False,
+                 timeout: Optional[float] = None):
+        """Register message handler.
+
+        command is matched exactly ("/start", "/start@BotName" works too),
+        as a prefix with prefix=True, or as a compiled regex. A handler
+        requiring two arguments also gets the parsed arguments: the words after
+        the command, the text after the prefix, or the re.Match.
+        With typed=True the handler gets a Message model instead of a dict.
+
+        cpu_bound=True runs the handler in a process pool (enable_cpu_pool):
+        it must be a module-level function and returns its API calls as
+        actions instead of making them, see apply_actions(). A call running
+        longer than timeout seconds is killed. The pool starts fresh
+        processes that import the bot script, which therefore has to run
+        the bot under ``if __name__ == "__main__":``.
+        """
+        def decorator(func):
+            handler = func
+            if cpu_bound:
+                if self.cpu_pool is None:
+                    self.enable_cpu_pool()
+                handler = CpuBoundHandler(self, func, timeout)
+            self.routes.add(command, handler, prefix, Message if typed else None)
+            self._handlers_changed()
+            return func
+        return decorator
+
+    def callback(self, callback_data: Union[str, Pattern], prefix: bool = False, typed: bool = False):
+        """Register callback_query handler, matched like function()"""
+        def decorator(func):
+            self.callbacks.add(callback_data, func, prefix, CallbackQuery if typed else None)
+            self._handlers_changed()
+            return func
+        return decorator
+
+    def on(self, update_type: str, content_type: Optional[str] = None, typed: bool = False):
+        """Register handler for any update type: on("inline_query"), on("poll_answer").
+
+        content_type narrows message updates: on("message", "photo"). Text
+        messages go to function() routes first and reach on("message",
+        "text") / on("message") only when no route matched; callback
+        queries likewise fall back to on("callback_query").
+        """
+        model = None
+        if typed:
+            model = UPDATE_MODELS.get(update_type)
+            if model is None:
+                raise ValueError(f"No typed model for {update_type} updates")
+        key = update_type if content_type is None else (update_type, content_type)
+
         def decorator(func):
-            self.routes[command] = func
+            self.handlers[key] = (func, False, model)
+            self._handlers_changed()
             return func
         return decorator
 
-    def callback(self, callback_data: str):
+    def derive_allowed_updates(self) -> List[str]:
+        """Update types the registered handlers use, sent as allowed_updates
+        so Telegram does not deliver the rest"""
+        if self.allowed_updates is not None:
+            return list(self.allowed_updates)
+        kinds = {key if isinstance(key, str) else key[0] for key in self.handlers}
+        if self.routes.exact or self.routes.prefixes or self.routes.patterns:
+            kinds.add("message")
+        if self.callbacks.exact or self.callbacks.prefixes or self.callbacks.patterns:
+            kinds.add("callback_query")
+        if self.lookup_cache is not None:
+            # Member changes invalidate cached lookups
+            kinds.update(("chat_member", "my_chat_member"))
+        return sorted(kinds)
+
+    def set_allowed_updates(self, allowed_updates: Optional[List[str]]):
+        """Use a fixed allowed_updates list, None derives it from handlers again"""
+        self.allowed_updates = allowed_updates
+        self._handlers_changed()
+
+    def _handlers_changed(self):
+        # Polling derives allowed_updates per request, a webhook set up by
+        # us has to be registered again
+        if self._webhook is None:
+            return None
+        allowed = self.derive_allowed_updates()
+        if allowed == self._webhook["allowed_updates"]:
+            return None
+        return self.set_webhook(self._webhook["url"], self._webhook["max_connections"],
+                                secret_token=self._webhook["secret_token"])
+
+    def content(self, *content_types: str, typed: bool = False):
+        """Register message handler by content: content("photo", "document")"""
         def decorator(func):
-            self.callbacks[callback_data] = func
+            for kind in content_types:
+                self.on("message", kind, typed)(func)
             return func
         return decorator
 
-    def runing(self):
+    def edited_message(self, typed: bool = False):
+        return self.on("edited_message", typed=typed)
+
+    def channel_post(self, typed: bool = False):
+        return self.on("channel_post", typed=typed)
+
+    def edited_channel_post(self, typed: bool = False):
+        return self.on("edited_channel_post", typed=typed)
+
+    def inline_query(self):
+        return self.on("inline_query")
+
+    def chosen_inline_result(self):
+        return self.on("chosen_inline_result")
+
+    def shipping_query(self):
+        return self.on("shipping_query")
+
+    def pre_checkout_query(self):
+        return self.on("pre_checkout_query")
+
+    def poll_answer(self):
+        return self.on("poll_answer")
+
+    def my_chat_member(self):
+        return self.on("my_chat_member")
+
+    def chat_member(self):
+        return self.on("chat_member")
+
+    def chat_join_request(self):
+        return self.on("chat_join_request")
+
+    def runing(self, limit: int = 100, timeout: int = 20, max_backoff: float = 30.0):
+        """Long-poll getUpdates and dispatch.
+
+        A full batch means more updates are waiting, so the next request is
+        sent right away without long polling; only an empty or partial batch
+        switches back to long polling with ``timeout``. Errors back off
+        exponentially up to ``max_backoff`` seconds.
+        """
         os.system("clear")
         print("[!] Warn: token checking...")
         
@@ -37,67 +229,329 @@ class Bot:
         os.system("clear")
         print("All processes are launched\nWetchgram working (@2025)")
         
+        self.dispatcher.start()
+        self._replay_pending()
         offset = 0
+        poll_timeout = 0
+        backoff = 0.0
+        try:
+            while True:
+                try:
+                    if self.offsets is not None:
+                        offset = self.offsets.poll_offset()
+                    updates = self._get_updates(offset, limit, poll_timeout)
+                    if updates is None:
+                        raise ConnectionError("getUpdates failed")
+                    backoff = 0.0
+                    fresh = 0
+                    for update in updates:
+                        offset = update["update_id"] + 1
+                        fresh += self._submit_update(update)
+                    poll_timeout = 0 if len(updates) >= limit else timeout
+                    if self.offsets is not None:
+                        self.offsets.commit()
+                        if updates and not fresh:
+                            # Only redeliveries: the journal could not be saved
+                            time.sleep(1.0)
+                except Exception as e:
+                    backoff = min(max_backoff, backoff * 2 or 0.5)
+                    print(f"Error: {e}, retrying in {backoff:.1f}s")
+                    time.sleep(backoff)
+        finally:
+            if self.offsets is not None:
+                self.offsets.commit(force=True)
+
+    def run_webhook(self,
+                    host: str = "0.0.0.0",
+                    port: int = 8443,
+                    path: str = "/webhook",
+                    secret_token: Optional[str] = None,
+                    url: Optional[str] = None,
+                    max_connections: int = 40,
+                    certfile: Optional[str] = None,
+                    keyfile: Optional[str] = None):
+        """Receive updates through a webhook instead of runing() polling.
+
+        When url is given the webhook is registered with Telegram first.
+        """
+        if not self._validate_token():
+            print("[!] Token failed validation")
+            return
+
+        if url:
+            self.set_webhook(url, max_connections=max_connections, secret_token=secret_token)
+
+        self.dispatcher.start()
+        self._replay_pending()
+        server = WebhookServer(host, port, path, self._submit_update,
+                               secret_token=secret_token, certfile=certfile, keyfile=keyfile,
+                               loads=self.codec.loads)
+        print(f"Wetchgram webhook listening on {host}:{port}{path}")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    def _submit_update(self, update: dict) -> bool:
+        """Queue update for the workers, False if it was already handled"""
+        if self.offsets is not None and not self.offsets.begin(update):
+            return False
+        # Pauses polling/webhook intake while the queue is full
+        self.dispatcher.wait_for_capacity()
+        # Same chat runs in order, different chats in parallel
+        if not self.dispatcher.submit(update):
+            self._update_done(update)
+        return True
+
+    def _replay_pending(self):
+        """Queue the updates the offset store journaled but the last run did not finish"""
+        if self.offsets is None:
+            return
+        for update in self.offsets.replay():
+            self.dispatcher.wait_for_capacity()
+            if not self.dispatcher.submit(update):
+                self._update_done(update)
+
+    def _update_done(self, update: dict):
+        if self.offsets is not None:
+            self.offsets.done(update["update_id"])
+
+    def enable_offset_store(self,
+                            store: Union[str, OffsetStore],
+                            commit_interval: float = 1.0,
+                            commit_every: int = 100,
+                            dedupe_size: int = 10000) -> OffsetTracker:
+        """Persist the update offset and journal the updates in flight.
+
+        store is an OffsetStore or a path: *.db/*.sqlite files use SQLite,
+        anything else a JSON file. Updates are saved before getUpdates
+        confirms them to Telegram, so polling never waits for a slow
+        handler. On restart the updates that were still being handled are
+        queued again and polling resumes after the last update taken in.
+        """
+        if isinstance(store, str):
+            store = SQLiteOffsetStore(store) if store.endswith((".db", ".sqlite", ".sqlite3")) else FileOffsetStore(store)
+        self.offsets = OffsetTracker(store, commit_interval, commit_every, dedupe_size)
+        return self.offsets
+
+    def enable_processes(self, processes: int = 4, max_pending: int = 10000) -> Supervisor:
+        """Run handlers in worker processes instead of threads of this one.
+
+        runing() or run_webhook() then only receive updates and route them
+        by chat to ``processes`` forked copies of this bot, each with its
+        own connection pool and worker threads, which the GIL does not
+        hold back. Register every handler before calling runing(). Chat
+        state kept in memory is local to the chat's process; the global
+        rate limit is split between the processes. POSIX only (fork).
+        """
+        local = self.dispatcher.local if isinstance(self.dispatcher, Supervisor) else self.dispatcher
+        self.dispatcher = Supervisor(self, local, processes, max_pending, self._update_done)
+        return self.dispatcher
+
+    def enable_cpu_pool(self, workers: Optional[int] = None) -> CpuPool:
+        """Process pool for cpu_bound handlers, one process per CPU by default"""
+        if self.cpu_pool is not None:
+            self.cpu_pool.shutdown()
+        self.cpu_pool = CpuPool(workers)
+        return self.cpu_pool
+
+    def apply_actions(self, actions: Union[dict, List[dict], None]):
+        """Execute what a cpu_bound handler returned.
+
+        An action is {"method": name, **params}: name is a Bot method
+        ("send_message") or a Bot API method ("sendMessage"). Handlers may
+        return one action, a list of them or None.
+        """
+        if actions is None:
+            return
+        for action in [actions] if isinstance(actions, dict) else actions:
+            params = dict(action)
+            method = params.pop("method")
+            call = None if method.startswith("_") else getattr(self, method, None)
+            if call is None:
+                self._request(method, params)
+            else:
+                call(**params)
+
+    def dispatch_stats(self) -> dict:
+        """Queue depth, dropped/shed updates and intake-to-start latency, also per lane"""
+        return self.dispatcher.stats()
+
+    def _validate_token(self) -> bool:
+        """Validate bot token"""
+        response = self._request("getMe")
+        if response.get("ok"):
+            self.username = response["result"].get("username")
+        return response.get("ok", False)
+
+    def _get_updates(self, offset: int, limit: int = 100, timeout: int = 20) -> Optional[list]:
+        """Fetch a batch of updates, None when the request failed"""
+        data = {"offset": offset, "timeout": timeout, "limit": limit,
+                "allowed_updates": self.derive_allowed_updates()}
+        response = self._request("getUpdates", data, timeout=timeout + 10)
+        if not response.get("ok"):
+            return None
+        return response.get("result", [])
+
+    # ==============================
+    # HTTP Session
+    # ==============================
+    def _create_session(self) -> requests.Session:
+        """Create pooled keep-alive session shared by every API call"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if self.user_agent:
+            session.headers["User-Agent"] = self.user_agent
+        return session
+
+    def _request(self,
+                 method: str,
+                 data: Optional[dict] = None,
+                 files: Optional[dict] = None,
+                 timeout: Optional[float] = None) -> dict:
+        """Single request path for every Bot API method"""
+        if self.lookup_cache is not None:
+            key = self.lookup_cache.key(method, data)
+            if key is not None:
+                return self.lookup_cache.fetch(key, partial(self._call, method, data, files, timeout))
+        if not files or self.file_cache is None:
+            result = self._call(method, data, files, timeout)
+            if self.lookup_cache is not None:
+                self.lookup_cache.after_call(method, data, result)
+            return result
+
+        cached_data, upload, used, uploads = self.file_cache.prepare(data, files)
+        result = self._call(method, cached_data, upload, timeout)
+        if used and _stale_file_id(result):
+            for key in used.values():
+                self.file_cache.invalidate(key)
+            cached_data, upload, used, uploads = self.file_cache.prepare(data, files, use_cache=False)
+            result = self._call(method, cached_data, upload, timeout)
+        self.file_cache.remember(uploads, result)
+        return result
+
+    def _call(self,
+              method: str,
+              data: Optional[dict] = None,
+              files: Optional[dict] = None,
+              timeout: Optional[float] = None) -> dict:
+        url = f"{API_URL}/bot{self.token}/{method}"
+        timeout = (self.connect_timeout, timeout or self.read_timeout)
+        chat_id = data.get("chat_id") if data else None
+        progress = partial(self.upload_progress, method) if files and self.upload_progress else None
+        try:
+            body = self._body(data, files, progress)
+        except (OSError, TypeError, ValueError) as e:
+            # Missing upload, unserializable field: no attempt can succeed
+            print(f"{_describe(method)} error: {e}")
+            return {}
+        started = time.monotonic()
+        attempt = 0
         while True:
+            flood = self.retry_policy.flood_delay(chat_id)
+            if flood > 0:
+                time.sleep(flood)
+            self._check_rate_limit(method, data)
+
+            status, result, error = None, None, None
             try:
-                updates = self._get_updates(offset)
-                for update in updates:
-                    offset = update["update_id"] + 1
-                    self.executor.submit(self._handle_update, update)
+                response = self._post(url, body, timeout)
+                status = response.status_code
+                result = self.codec.loads(response.content)
             except Exception as e:
-                print(f"Error: {e}")
-            time.sleep(0.1)
+                error = e
 
-    def _validate_token(self) -> bool:
-        """Validate bot token"""
-        url = f"https://api.telegram.org/bot{self.token}/getMe"
-        try:
-            response = requests.get(url, timeout=10)
-            return response.json().get("ok", False)
-        except Exception as e:
-            print(f"Token validation error: {e}")
-            return False
+            delay = self.retry_policy.retry_delay(method, chat_id, attempt, started, status, result, error)
+            if delay is None:
+                break
+            time.sleep(delay)
+            attempt += 1
 
-    def _get_updates(self, offset: int) -> list:
-        url = f"https://api.telegram.org/bot{self.token}/getUpdates"
-        params = {"offset": offset, "timeout": 20, "limit": 100}
-        try:
-            response = requests.get(url, params=params, timeout=25)
-            return response.json().get("result", [])
-        except requests.exceptions.RequestException as e:
-            print(f"Update error: {e}")
-            return []
+        if result is None:
+            print(f"{_describe(method)} error: {error}")
+            return {}
+        return result
+
+    def _body(self,
+              data: Optional[dict],
+              files: Optional[dict],
+              progress: Optional[Callable[[int, Optional[int]], None]] = None):
+        """Request body built once per call: None, JSON bytes or a MultipartEncoder"""
+        if not files:
+            return None if data is None else self.codec.dumps_request(data)
+        _rewind(files)
+        return MultipartEncoder(_form_fields(data, self.codec), files, progress=progress)
+
+    def _post(self, url: str, body, timeout) -> requests.Response:
+        if not isinstance(body, MultipartEncoder):
+            if body is None:
+                return self.session.post(url, timeout=timeout)
+            return self.session.post(url, data=body, headers=JSON_HEADERS, timeout=timeout)
+        body.rewind()
+        connect_timeout, read_timeout = timeout
+        # Unknown size (iterator source) goes out chunked
+        return self.session.post(url,
+                                 data=body if body.total is not None else body.chunks(),
+                                 headers={"Content-Type": body.content_type},
+                                 timeout=(connect_timeout, _upload_timeout(read_timeout, body.total)))
 
     def _handle_update(self, update: dict):
-        if "message" in update:
-            self._handle_message(update["message"])
-        elif "callback_query" in update:
-            self._handle_callback(update["callback_query"])
-
-    def _handle_message(self, message: dict):
-        text = message.get("text", "")
-        if not text:
+        if self.lookup_cache is not None:
+            self.lookup_cache.observe_update(update)
+        match = self._match_update(update)
+        if match is None:
             return
-            
-        parts = text.split()
-        command = parts[0]
-        
-        for registered_command, handler in self.routes.items():
-            if command == registered_command:
-                try:
-                    handler(message)
-                except Exception as e:
-                    print(f"Handler error: {e}")
-                return
-
-    def _handle_callback(self, callback_query: dict):
-        data = callback_query.get("data", "")
-        for callback_data, handler in self.callbacks.items():
-            if data == callback_data:
-                try:
-                    handler(callback_query)
-                except Exception as e:
-                    print(f"Callback error: {e}")
+        handler, payload, args = match
+        try:
+            handler(payload, *args)
+        except Exception as e:
+            print(f"Handler error: {e}")
+
+    def _match_update(self, update: dict):
+        """Resolve update to (handler, payload, extra args), shared by Bot and AsyncBot"""
+        kind = update_type(update)
+        return self._matchers.get(kind, self._match_handler)(update.get(kind), kind)
+
+    def _match_message(self, message: dict, kind: str = "message"):
+        text = message.get("text")
+        split = split_command(text, self.username) if text else None
+        if split is None:
+            # Not text, or /command@OtherBot
+            return self._match_handler(message, kind) if text is None else None
+        command, rest = split
+        entry = self.routes.exact.get(command)
+        if entry is not None:
+            args = rest.split()
+        else:
+            found = self.routes.match(text)
+            if found is None:
+                return self._match_handler(message, kind)
+            entry, args = found
+        handler, pass_args, model = entry
+        payload = message if model is None else model(message)
+        return handler, payload, (args,) if pass_args else ()
+
+    def _match_callback(self, callback_query: dict, kind: str = "callback_query"):
+        found = self.callbacks.match(callback_query.get("data", ""))
+        if found is None:
+            return self._match_handler(callback_query, kind)
+        (handler, pass_args, model), args = found
+        payload = callback_query if model is None else model(callback_query)
+        return handler, payload, (args,) if pass_args else ()
+
+    def _match_handler(self, payload: Any, kind: str):
+        """Handler registered with on(): by content type for messages, else by update type"""
+        entry = None
+        if kind in MESSAGE_UPDATES:
+            entry = self.handlers.get((kind, content_type(payload)))
+        if entry is None:
+            entry = self.handlers.get(kind)
+            if entry is None:
+                return None
+        handler, _, model = entry
+        return handler, payload if model is None else model(payload), ()
 
     # ==============================
     # Core Message Methods
@@ -107,61 +561,41 @@ class Bot:
                    text: str, 
                    reply_markup: Optional[dict] = None,
                    parse_mode: Optional[str] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
         data = {"chat_id": chat_id, "text": text}
         if reply_markup: data["reply_markup"] = reply_markup
         if parse_mode: data["parse_mode"] = parse_mode
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Send message error: {e}")
-            return {}
+        return self._request("sendMessage", data)
 
     def edit_message(self,
                     chat_id: int,
                     message_id: int,
                     text: str,
                     reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/editMessageText"
         data = {
             "chat_id": chat_id,
             "message_id": message_id,
             "text": text
         }
         if reply_markup: data["reply_markup"] = reply_markup
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Edit message error: {e}")
-            return {}
+        return self._request("editMessageText", data)
 
     def delete_message(self, chat_id: int, message_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/deleteMessage"
         data = {
             "chat_id": chat_id,
             "message_id": message_id
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Delete message error: {e}")
-            return {}
+        return self._request("deleteMessage", data)
 
     def forward_message(self,
                       chat_id: int,
                       from_chat_id: int,
                       message_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/forwardMessage"
         data = {
             "chat_id": chat_id,
             "from_chat_id": from_chat_id,
             "message_id": message_id
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Forward message error: {e}")
-            return {}
+        return self._request("forwardMessage", data)
 
     def copy_message(self,
                    chat_id: int,
@@ -169,7 +603,6 @@ class Bot:
                    message_id: int,
                    caption: Optional[str] = None,
                    reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/copyMessage"
         data = {
             "chat_id": chat_id,
             "from_chat_id": from_chat_id,
@@ -177,11 +610,7 @@ class Bot:
         }
         if caption: data["caption"] = caption
         if reply_markup: data["reply_markup"] = reply_markup
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Copy message error: {e}")
-            return {}
+        return self._request("copyMessage", data)
 
     # ==============================
     # Media Methods
@@ -191,55 +620,26 @@ class Bot:
                  photo: Union[str, bytes],
                  caption: Optional[str] = None,
                  reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendPhoto"
         data = {"chat_id": chat_id}
         files = None
-        
-        try:
-            if isinstance(photo, str):
-                if photo.startswith(('http://', 'https://')):
-                    data['photo'] = photo
-                else:
-                    with open(photo, 'rb') as f:
-                        files = {'photo': f}
-                        if caption: data['caption'] = caption
-                        if reply_markup: data['reply_markup'] = reply_markup
-                        return requests.post(url, data=data, files=files).json()
-            else:
-                files = {'photo': photo}
-            
-            if caption: data['caption'] = caption
-            if reply_markup: data['reply_markup'] = reply_markup
-            return requests.post(url, data=data, files=files).json()
-        except Exception as e:
-            print(f"Send photo error: {e}")
-            return {}
+        if isinstance(photo, str) and photo.startswith(('http://', 'https://')):
+            data['photo'] = photo
+        else:
+            files = {'photo': photo}
+        if caption: data['caption'] = caption
+        if reply_markup: data['reply_markup'] = reply_markup
+        return self._request("sendPhoto", data, files)
 
     def send_document(self,
                     chat_id: int,
                     document: Union[str, bytes],
                     caption: Optional[str] = None,
                     reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendDocument"
         data = {"chat_id": chat_id}
-        files = None
-        
-        try:
-            if isinstance(document, str):
-                with open(document, 'rb') as f:
-                    files = {'document': f}
-                    if caption: data['caption'] = caption
-                    if reply_markup: data['reply_markup'] = reply_markup
-                    return requests.post(url, data=data, files=files).json()
-            else:
-                files = {'document': document}
-            
-            if caption: data['caption'] = caption
-            if reply_markup: data['reply_markup'] = reply_markup
-            return requests.post(url, data=data, files=files).json()
-        except Exception as e:
-            print(f"Send document error: {e}")
-            return {}
+        files = {'document': document}
+        if caption: data['caption'] = caption
+        if reply_markup: data['reply_markup'] = reply_markup
+        return self._request("sendDocument", data, files)
 
     def send_audio(self,
                  chat_id: int,
@@ -249,32 +649,14 @@ class Bot:
                  performer: Optional[str] = None,
                  title: Optional[str] = None,
                  reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendAudio"
         data = {"chat_id": chat_id}
-        files = None
-        
-        try:
-            if isinstance(audio, str):
-                with open(audio, 'rb') as f:
-                    files = {'audio': f}
-                    if caption: data['caption'] = caption
-                    if duration: data['duration'] = duration
-                    if performer: data['performer'] = performer
-                    if title: data['title'] = title
-                    if reply_markup: data['reply_markup'] = reply_markup
-                    return requests.post(url, data=data, files=files).json()
-            else:
-                files = {'audio': audio}
-            
-            if caption: data['caption'] = caption
-            if duration: data['duration'] = duration
-            if performer: data['performer'] = performer
-            if title: data['title'] = title
-            if reply_markup: data['reply_markup'] = reply_markup
-            return requests.post(url, data=data, files=files).json()
-        except Exception as e:
-            print(f"Send audio error: {e}")
-            return {}
+        files = {'audio': audio}
+        if caption: data['caption'] = caption
+        if duration: data['duration'] = duration
+        if performer: data['performer'] = performer
+        if title: data['title'] = title
+        if reply_markup: data['reply_markup'] = reply_markup
+        return self._request("sendAudio", data, files)
 
     def send_video(self,
                  chat_id: int,
@@ -284,32 +666,14 @@ class Bot:
                  width: Optional[int] = None,
                  height: Optional[int] = None,
                  reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendVideo"
         data = {"chat_id": chat_id}
-        files = None
-        
-        try:
-            if isinstance(video, str):
-                with open(video, 'rb') as f:
-                    files = {'video': f}
-                    if caption: data['caption'] = caption
-                    if duration: data['duration'] = duration
-                    if width: data['width'] = width
-                    if height: data['height'] = height
-                    if reply_markup: data['reply_markup'] = reply_markup
-                    return requests.post(url, data=data, files=files).json()
-            else:
-                files = {'video': video}
-            
-            if caption: data['caption'] = caption
-            if duration: data['duration'] = duration
-            if width: data['width'] = width
-            if height: data['height'] = height
-            if reply_markup: data['reply_markup'] = reply_markup
-            return requests.post(url, data=data, files=files).json()
-        except Exception as e:
-            print(f"Send video error: {e}")
-            return {}
+        files = {'video': video}
+        if caption: data['caption'] = caption
+        if duration: data['duration'] = duration
+        if width: data['width'] = width
+        if height: data['height'] = height
+        if reply_markup: data['reply_markup'] = reply_markup
+        return self._request("sendVideo", data, files)
 
     def send_voice(self,
                  chat_id: int,
@@ -317,28 +681,12 @@ class Bot:
                  caption: Optional[str] = None,
                  duration: Optional[int] = None,
                  reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendVoice"
         data = {"chat_id": chat_id}
-        files = None
-        
-        try:
-            if isinstance(voice, str):
-                with open(voice, 'rb') as f:
-                    files = {'voice': f}
-                    if caption: data['caption'] = caption
-                    if duration: data['duration'] = duration
-                    if reply_markup: data['reply_markup'] = reply_markup
-                    return requests.post(url, data=data, files=files).json()
-            else:
-                files = {'voice': voice}
-            
-            if caption: data['caption'] = caption
-            if duration: data['duration'] = duration
-            if reply_markup: data['reply_markup'] = reply_markup
-            return requests.post(url, data=data, files=files).json()
-        except Exception as e:
-            print(f"Send voice error: {e}")
-            return {}
+        files = {'voice': voice}
+        if caption: data['caption'] = caption
+        if duration: data['duration'] = duration
+        if reply_markup: data['reply_markup'] = reply_markup
+        return self._request("sendVoice", data, files)
 
     def send_video_note(self,
                       chat_id: int,
@@ -346,81 +694,83 @@ class Bot:
                       duration: Optional[int] = None,
                       length: Optional[int] = None,
                       reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendVideoNote"
         data = {"chat_id": chat_id}
-        files = None
-        
-        try:
-            if isinstance(video_note, str):
-                with open(video_note, 'rb') as f:
-                    files = {'video_note': f}
-                    if duration: data['duration'] = duration
-                    if length: data['length'] = length
-                    if reply_markup: data['reply_markup'] = reply_markup
-                    return requests.post(url, data=data, files=files).json()
-            else:
-                files = {'video_note': video_note}
-            
-            if duration: data['duration'] = duration
-            if length: data['length'] = length
-            if reply_markup: data['reply_markup'] = reply_markup
-            return requests.post(url, data=data, files=files).json()
-        except Exception as e:
-            print(f"Send video note error: {e}")
-            return {}
+        files = {'video_note': video_note}
+        if duration: data['duration'] = duration
+        if length: data['length'] = length
+        if reply_markup: data['reply_markup'] = reply_markup
+        return self._request("sendVideoNote", data, files)
 
     def send_media_group(self,
                        chat_id: int,
                        media: List[Dict[str, Any]],
                        disable_notification: Optional[bool] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendMediaGroup"
         data = {
             "chat_id": chat_id,
             "media": media
         }
         if disable_notification is not None:
             data["disable_notification"] = disable_notification
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Send media group error: {e}")
-            return {}
+        return self._request("sendMediaGroup", data)
 
     def edit_message_media(self,
                          chat_id: int,
                          message_id: int,
                          media: Dict[str, Any],
                          reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/editMessageMedia"
         data = {
             "chat_id": chat_id,
             "message_id": message_id,
             "media": media
         }
         if reply_markup: data["reply_markup"] = reply_markup
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Edit message media error: {e}")
-            return {}
+        return self._request("editMessageMedia", data)
 
     def edit_message_caption(self,
                            chat_id: int,
                            message_id: int,
                            caption: Optional[str] = None,
                            reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/editMessageCaption"
         data = {
             "chat_id": chat_id,
             "message_id": message_id
         }
         if caption: data["caption"] = caption
         if reply_markup: data["reply_markup"] = reply_markup
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Edit message caption error: {e}")
-            return {}
+        return self._request("editMessageCaption", data)
+
+    def enable_edit_coalescing(self, window: float = 0.5) -> EditCoalescer:
+        """Return coalescer whose edit_message/edit_message_caption/edit_message_media
+        send only the latest edit per message and window, returning Futures"""
+        if self.edits is None or self.edits.window != window:
+            old, self.edits = self.edits, EditCoalescer(self, window)
+            if old is not None:
+                old.shutdown()
+        return self.edits
+
+    def enable_file_cache(self,
+                          max_size: int = 1024,
+                          path: Optional[str] = None,
+                          hash_content: bool = False) -> FileIdCache:
+        """Upload each local file once, later sends reuse its file_id.
+
+        path keeps the cache in an SQLite file across restarts.
+        """
+        self.file_cache = FileIdCache(max_size, path, hash_content)
+        return self.file_cache
+
+    def enable_lookup_cache(self,
+                            ttls: Optional[Dict[str, float]] = None,
+                            max_size: int = 10000) -> LookupCache:
+        """Cache get_file, get_chat, get_chat_member and get_chat_administrators.
+
+        ttls overrides seconds per method, e.g. {"get_chat_member": 30};
+        0 disables caching of that method. Member entries are invalidated
+        by chat_member updates and our own promote/restrict/ban calls.
+        """
+        self.lookup_cache = LookupCache(ttls, max_size)
+        self._handlers_changed()
+        return self.lookup_cache
 
     # ==============================
     # Stickers and Dice
@@ -429,43 +779,25 @@ class Bot:
                    chat_id: int,
                    sticker: Union[str, bytes],
                    reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendSticker"
         data = {"chat_id": chat_id}
         files = None
-        
-        try:
-            if isinstance(sticker, str):
-                if sticker.startswith(('http://', 'https://')):
-                    data['sticker'] = sticker
-                else:
-                    with open(sticker, 'rb') as f:
-                        files = {'sticker': f}
-                        if reply_markup: data['reply_markup'] = reply_markup
-                        return requests.post(url, data=data, files=files).json()
-            else:
-                files = {'sticker': sticker}
-            
-            if reply_markup: data['reply_markup'] = reply_markup
-            return requests.post(url, data=data, files=files).json()
-        except Exception as e:
-            print(f"Send sticker error: {e}")
-            return {}
+        if isinstance(sticker, str) and sticker.startswith(('http://', 'https://')):
+            data['sticker'] = sticker
+        else:
+            files = {'sticker': sticker}
+        if reply_markup: data['reply_markup'] = reply_markup
+        return self._request("sendSticker", data, files)
 
     def send_dice(self,
                 chat_id: int,
                 emoji: str = "🎲",
                 reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendDice"
         data = {
             "chat_id": chat_id,
             "emoji": emoji
         }
         if reply_markup: data["reply_markup"] = reply_markup
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Send dice error: {e}")
-            return {}
+        return self._request("sendDice", data)
 
     # ==============================
     # Polls and Quizzes
@@ -483,7 +815,6 @@ class Bot:
                 close_date: Optional[int] = None,
                 is_closed: bool = False,
                 reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendPoll"
         data = {
             "chat_id": chat_id,
             "question": question,
@@ -498,195 +829,104 @@ class Bot:
         if close_date: data["close_date"] = close_date
         if is_closed: data["is_closed"] = True
         if reply_markup: data["reply_markup"] = reply_markup
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Send poll error: {e}")
-            return {}
+        return self._request("sendPoll", data)
 
     def stop_poll(self,
                 chat_id: int,
                 message_id: int,
                 reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/stopPoll"
         data = {
             "chat_id": chat_id,
             "message_id": message_id
         }
         if reply_markup: data["reply_markup"] = reply_markup
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Stop poll error: {e}")
-            return {}
+        return self._request("stopPoll", data)
 
     # ==============================
     # Chat Management
     # ==============================
     def get_chat(self, chat_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/getChat"
         data = {"chat_id": chat_id}
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Get chat error: {e}")
-            return {}
+        return self._request("getChat", data)
 
     def get_chat_administrators(self, chat_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/getChatAdministrators"
         data = {"chat_id": chat_id}
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Get chat administrators error: {e}")
-            return {}
+        return self._request("getChatAdministrators", data)
 
     def get_chat_members_count(self, chat_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/getChatMembersCount"
         data = {"chat_id": chat_id}
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Get chat members count error: {e}")
-            return {}
+        return self._request("getChatMembersCount", data)
 
     def get_chat_member(self, chat_id: int, user_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/getChatMember"
         data = {
             "chat_id": chat_id,
             "user_id": user_id
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Get chat member error: {e}")
-            return {}
+        return self._request("getChatMember", data)
 
     def leave_chat(self, chat_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/leaveChat"
         data = {"chat_id": chat_id}
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Leave chat error: {e}")
-            return {}
+        return self._request("leaveChat", data)
 
     def set_chat_title(self, chat_id: int, title: str) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/setChatTitle"
         data = {
             "chat_id": chat_id,
             "title": title
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Set chat title error: {e}")
-            return {}
+        return self._request("setChatTitle", data)
 
     def set_chat_description(self, chat_id: int, description: str) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/setChatDescription"
         data = {
             "chat_id": chat_id,
             "description": description
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Set chat description error: {e}")
-            return {}
+        return self._request("setChatDescription", data)
 
     def pin_chat_message(self,
                        chat_id: int,
                        message_id: int,
                        disable_notification: bool = False) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/pinChatMessage"
         data = {
             "chat_id": chat_id,
             "message_id": message_id,
             "disable_notification": disable_notification
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Pin chat message error: {e}")
-            return {}
+        return self._request("pinChatMessage", data)
 
     def unpin_chat_message(self, chat_id: int, message_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/unpinChatMessage"
         data = {
             "chat_id": chat_id,
             "message_id": message_id
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Unpin chat message error: {e}")
-            return {}
+        return self._request("unpinChatMessage", data)
 
     def unpin_all_chat_messages(self, chat_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/unpinAllChatMessages"
         data = {"chat_id": chat_id}
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Unpin all chat messages error: {e}")
-            return {}
+        return self._request("unpinAllChatMessages", data)
 
     def export_chat_invite_link(self, chat_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/exportChatInviteLink"
         data = {"chat_id": chat_id}
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Export chat invite link error: {e}")
-            return {}
+        return self._request("exportChatInviteLink", data)
 
     def set_chat_photo(self, chat_id: int, photo: Union[str, bytes]) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/setChatPhoto"
         data = {"chat_id": chat_id}
-        files = None
-        
-        try:
-            if isinstance(photo, str):
-                with open(photo, 'rb') as f:
-                    files = {'photo': f}
-                    return requests.post(url, data=data, files=files).json()
-            else:
-                files = {'photo': photo}
-                return requests.post(url, data=data, files=files).json()
-        except Exception as e:
-            print(f"Set chat photo error: {e}")
-            return {}
+        files = {'photo': photo}
+        return self._request("setChatPhoto", data, files)
 
     def delete_chat_photo(self, chat_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/deleteChatPhoto"
         data = {"chat_id": chat_id}
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Delete chat photo error: {e}")
-            return {}
+        return self._request("deleteChatPhoto", data)
 
     def set_chat_sticker_set(self, chat_id: int, sticker_set_name: str) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/setChatStickerSet"
         data = {
             "chat_id": chat_id,
             "sticker_set_name": sticker_set_name
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Set chat sticker set error: {e}")
-            return {}
+        return self._request("setChatStickerSet", data)
 
     def delete_chat_sticker_set(self, chat_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/deleteChatStickerSet"
         data = {"chat_id": chat_id}
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Delete chat sticker set error: {e}")
-            return {}
+        return self._request("deleteChatStickerSet", data)
 
     # ==============================
     # Forum Topics
@@ -696,92 +936,62 @@ class Bot:
                          name: str,
                          icon_color: Optional[int] = None,
                          icon_custom_emoji_id: Optional[str] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/createForumTopic"
         data = {
             "chat_id": chat_id,
             "name": name
         }
         if icon_color: data["icon_color"] = icon_color
         if icon_custom_emoji_id: data["icon_custom_emoji_id"] = icon_custom_emoji_id
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Create forum topic error: {e}")
-            return {}
+        return self._request("createForumTopic", data)
 
     def edit_forum_topic(self,
                        chat_id: int,
                        message_thread_id: int,
                        name: Optional[str] = None,
                        icon_custom_emoji_id: Optional[str] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/editForumTopic"
         data = {
             "chat_id": chat_id,
             "message_thread_id": message_thread_id
         }
         if name: data["name"] = name
         if icon_custom_emoji_id: data["icon_custom_emoji_id"] = icon_custom_emoji_id
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Edit forum topic error: {e}")
-            return {}
+        return self._request("editForumTopic", data)
 
     def close_forum_topic(self,
                         chat_id: int,
                         message_thread_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/closeForumTopic"
         data = {
             "chat_id": chat_id,
             "message_thread_id": message_thread_id
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Close forum topic error: {e}")
-            return {}
+        return self._request("closeForumTopic", data)
 
     def reopen_forum_topic(self,
                          chat_id: int,
                          message_thread_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/reopenForumTopic"
         data = {
             "chat_id": chat_id,
             "message_thread_id": message_thread_id
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Reopen forum topic error: {e}")
-            return {}
+        return self._request("reopenForumTopic", data)
 
     def delete_forum_topic(self,
                          chat_id: int,
                          message_thread_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/deleteForumTopic"
         data = {
             "chat_id": chat_id,
             "message_thread_id": message_thread_id
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Delete forum topic error: {e}")
-            return {}
+        return self._request("deleteForumTopic", data)
 
     def unpin_all_forum_topic_messages(self,
                                      chat_id: int,
                                      message_thread_id: int) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/unpinAllForumTopicMessages"
         data = {
             "chat_id": chat_id,
             "message_thread_id": message_thread_id
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Unpin all forum topic messages error: {e}")
-            return {}
+        return self._request("unpinAllForumTopicMessages", data)
 
     # ==============================
     # Webhook Methods
@@ -789,37 +999,33 @@ class Bot:
     def set_webhook(self,
                    url: str,
                    max_connections: int = 40,
-                   allowed_updates: Optional[List[str]] = None) -> dict:
-        webhook_url = f"https://api.telegram.org/bot{self.token}/setWebhook"
+                   allowed_updates: Optional[List[str]] = None,
+                   secret_token: Optional[str] = None) -> dict:
+        """Register the webhook. Without allowed_updates they are derived
+        from the handlers and kept in sync when handlers are added later."""
         data = {
             "url": url,
             "max_connections": max_connections
         }
-        if allowed_updates: data["allowed_updates"] = allowed_updates
-        try:
-            return requests.post(webhook_url, json=data).json()
-        except Exception as e:
-            print(f"Set webhook error: {e}")
-            return {}
+        if allowed_updates is None:
+            data["allowed_updates"] = self.derive_allowed_updates()
+            self._webhook = {"url": url, "max_connections": max_connections,
+                             "secret_token": secret_token, "allowed_updates": data["allowed_updates"]}
+        else:
+            data["allowed_updates"] = allowed_updates
+            self._webhook = None
+        if secret_token: data["secret_token"] = secret_token
+        return self._request("setWebhook", data)
 
     def delete_webhook(self, drop_pending_updates: bool = False) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/deleteWebhook"
+        self._webhook = None
         data = {
             "drop_pending_updates": drop_pending_updates
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Delete webhook error: {e}")
-            return {}
+        return self._request("deleteWebhook", data)
 
     def get_webhook_info(self) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/getWebhookInfo"
-        try:
-            return requests.get(url).json()
-        except Exception as e:
-            print(f"Get webhook info error: {e}")
-            return {}
+        return self._request("getWebhookInfo")
 
     # ==============================
     # Bot Management
@@ -827,38 +1033,23 @@ class Bot:
     def set_my_description(self,
                          description: str,
                          language_code: Optional[str] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/setMyDescription"
         data = {"description": description}
         if language_code: data["language_code"] = language_code
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Set my description error: {e}")
-            return {}
+        return self._request("setMyDescription", data)
 
     def set_my_name(self,
                    name: str,
                    language_code: Optional[str] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/setMyName"
         data = {"name": name}
         if language_code: data["language_code"] = language_code
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Set my name error: {e}")
-            return {}
+        return self._request("setMyName", data)
 
     def set_my_short_description(self,
                                short_description: str,
                                language_code: Optional[str] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/setMyShortDescription"
         data = {"short_description": short_description}
         if language_code: data["language_code"] = language_code
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Set my short description error: {e}")
-            return {}
+        return self._request("setMyShortDescription", data)
 
     # ==============================
     # Games
@@ -867,17 +1058,12 @@ class Bot:
                 chat_id: int,
                 game_short_name: str,
                 reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendGame"
         data = {
             "chat_id": chat_id,
             "game_short_name": game_short_name
         }
         if reply_markup: data["reply_markup"] = reply_markup
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Send game error: {e}")
-            return {}
+        return self._request("sendGame", data)
 
     def set_game_score(self,
                      user_id: int,
@@ -887,7 +1073,6 @@ class Bot:
                      chat_id: Optional[int] = None,
                      message_id: Optional[int] = None,
                      inline_message_id: Optional[str] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/setGameScore"
         data = {
             "user_id": user_id,
             "score": score,
@@ -897,27 +1082,18 @@ class Bot:
         if chat_id: data["chat_id"] = chat_id
         if message_id: data["message_id"] = message_id
         if inline_message_id: data["inline_message_id"] = inline_message_id
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Set game score error: {e}")
-            return {}
+        return self._request("setGameScore", data)
 
     def get_game_high_scores(self,
                            user_id: int,
                            chat_id: Optional[int] = None,
                            message_id: Optional[int] = None,
                            inline_message_id: Optional[str] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/getGameHighScores"
         data = {"user_id": user_id}
         if chat_id: data["chat_id"] = chat_id
         if message_id: data["message_id"] = message_id
         if inline_message_id: data["inline_message_id"] = inline_message_id
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Get game high scores error: {e}")
-            return {}
+        return self._request("getGameHighScores", data)
 
     # ==============================
     # Payments
@@ -942,7 +1118,6 @@ class Bot:
                    is_flexible: bool = False,
                    disable_notification: bool = False,
                    reply_markup: Optional[dict] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendInvoice"
         data = {
             "chat_id": chat_id,
             "title": title,
@@ -964,45 +1139,31 @@ class Bot:
         if photo_width: data["photo_width"] = photo_width
         if photo_height: data["photo_height"] = photo_height
         if reply_markup: data["reply_markup"] = reply_markup
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Send invoice error: {e}")
-            return {}
+        return self._request("sendInvoice", data)
 
     def answer_shipping_query(self,
                             shipping_query_id: str,
                             ok: bool,
                             shipping_options: Optional[List[Dict[str, Any]]] = None,
                             error_message: Optional[str] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/answerShippingQuery"
         data = {
             "shipping_query_id": shipping_query_id,
             "ok": ok
         }
         if shipping_options: data["shipping_options"] = shipping_options
         if error_message: data["error_message"] = error_message
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Answer shipping query error: {e}")
-            return {}
+        return self._request("answerShippingQuery", data)
 
     def answer_pre_checkout_query(self,
                                 pre_checkout_query_id: str,
                                 ok: bool,
                                 error_message: Optional[str] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/answerPreCheckoutQuery"
         data = {
             "pre_checkout_query_id": pre_checkout_query_id,
             "ok": ok
         }
         if error_message: data["error_message"] = error_message
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Answer pre checkout query error: {e}")
-            return {}
+        return self._request("answerPreCheckoutQuery", data)
 
     # ==============================
     # Inline Mode
@@ -1015,7 +1176,6 @@ class Bot:
                           next_offset: Optional[str] = None,
                           switch_pm_text: Optional[str] = None,
                           switch_pm_parameter: Optional[str] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/answerInlineQuery"
         data = {
             "inline_query_id": inline_query_id,
             "results": results,
@@ -1025,11 +1185,7 @@ class Bot:
         if next_offset: data["next_offset"] = next_offset
         if switch_pm_text: data["switch_pm_text"] = switch_pm_text
         if switch_pm_parameter: data["switch_pm_parameter"] = switch_pm_parameter
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Answer inline query error: {e}")
-            return {}
+        return self._request("answerInlineQuery", data)
 
     # ==============================
     # Web Apps
@@ -1037,16 +1193,11 @@ class Bot:
     def answer_web_app_query(self,
                            web_app_query_id: str,
                            result: Dict[str, Any]) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/answerWebAppQuery"
         data = {
             "web_app_query_id": web_app_query_id,
             "result": result
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Answer web app query error: {e}")
-            return {}
+        return self._request("answerWebAppQuery", data)
 
     # ==============================
     # User Management
@@ -1065,7 +1216,6 @@ class Bot:
                           can_change_info: bool = False,
                           can_invite_users: bool = False,
                           can_pin_messages: bool = False) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/promoteChatMember"
         data = {
             "chat_id": chat_id,
             "user_id": user_id,
@@ -1081,63 +1231,44 @@ class Bot:
             "can_invite_users": can_invite_users,
             "can_pin_messages": can_pin_messages
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Promote chat member error: {e}")
-            return {}
+        return self._request("promoteChatMember", data)
 
     def restrict_chat_member(self,
                            chat_id: int,
                            user_id: int,
                            permissions: Dict[str, bool],
                            until_date: Optional[int] = None) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/restrictChatMember"
         data = {
             "chat_id": chat_id,
             "user_id": user_id,
             "permissions": permissions
         }
         if until_date: data["until_date"] = until_date
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Restrict chat member error: {e}")
-            return {}
+        return self._request("restrictChatMember", data)
 
     def ban_chat_member(self,
                        chat_id: int,
                        user_id: int,
                        until_date: Optional[int] = None,
                        revoke_messages: bool = False) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/banChatMember"
         data = {
             "chat_id": chat_id,
             "user_id": user_id,
             "revoke_messages": revoke_messages
         }
         if until_date: data["until_date"] = until_date
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Ban chat member error: {e}")
-            return {}
+        return self._request("banChatMember", data)
 
     def unban_chat_member(self,
                          chat_id: int,
                          user_id: int,
                          only_if_banned: bool = False) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/unbanChatMember"
         data = {
             "chat_id": chat_id,
             "user_id": user_id,
             "only_if_banned": only_if_banned
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Unban chat member error: {e}")
-            return {}
+        return self._request("unbanChatMember", data)
 
     # ==============================
     # Keyboard Methods
@@ -1159,17 +1290,12 @@ class Bot:
                       callback_query_id: str,
                       text: Optional[str] = None,
                       show_alert: bool = False) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/answerCallbackQuery"
         data = {
             "callback_query_id": callback_query_id,
             "show_alert": show_alert
         }
         if text: data["text"] = text
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Callback answer error: {e}")
-            return {}
+        return self._request("answerCallbackQuery", data)
 
     # ==============================
     # Utility Methods
@@ -1177,37 +1303,80 @@ class Bot:
     def send_chat_action(self,
                        chat_id: int,
                        action: str) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendChatAction"
         data = {
             "chat_id": chat_id,
             "action": action
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Send chat action error: {e}")
-            return {}
+        return self._request("sendChatAction", data)
 
     def get_file(self, file_id: str) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/getFile"
         data = {"file_id": file_id}
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Get file error: {e}")
-            return {}
-
-    def download_file(self, file_path: str, destination: str) -> bool:
-        url = f"https://api.telegram.org/file/bot{self.token}/{file_path}"
-        try:
-            response = requests.get(url, stream=True)
-            with open(destination, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            return True
+        return self._request("getFile", data)
+
+    def download_file(self,
+                      file_path: str,
+                      destination: Any = None,
+                      expected_size: Optional[int] = None,
+                      chunk_size: int = 256 * 1024,
+                      segments: int = 4) -> Union[bool, bytes, None]:
+        """Download file_path from get_file.
+
+        destination is a path (written atomically, interrupted downloads
+        resume), a BytesIO/file object, bytearray or memoryview. Without a
+        destination the content is returned as bytes, None on error.
+        expected_size (file_size from get_file) is verified when given.
+        """
+        url = f"{API_URL}/file/bot{self.token}/{file_path}"
+        downloader = Downloader(self.session, (self.connect_timeout, self.read_timeout), chunk_size, segments)
+        target = bytearray() if destination is None else destination
+        try:
+            downloader.download(url, target, expected_size)
         except Exception as e:
             print(f"Download file error: {e}")
-            return False
+            return None if destination is None else False
+        return bytes(target) if destination is None else True
+
+    def download_many(self,
+                      files: Iterable[Union[str, dict]],
+                      dest_dir: str,
+                      concurrency: int = 8) -> Iterator[dict]:
+        """Fetch many files off the handler threads.
+
+        files are file_ids or file dicts from a message (a PhotoSize,
+        document, ...). Each file_unique_id is fetched once, into
+        dest_dir/<file_unique_id><ext>, with up to concurrency downloads on
+        a pool separate from update handling. Results are yielded as files
+        complete: {"file_id", "file_unique_id", "path", "ok", "error"}; a
+        failed file only fails its own result. Connections past the
+        session's pool_size are not kept alive, raise pool_size when
+        concurrency goes far beyond the default.
+        """
+        if concurrency > self._download_workers:
+            # A running download_many keeps the smaller pool it started with,
+            # whose threads exit once it finishes and drops the pool
+            self.download_pool = ThreadPoolExecutor(max_workers=concurrency,
+                                                    thread_name_prefix="wetchgram-download")
+            self._download_workers = concurrency
+        return download_many(self, files, dest_dir, self.download_pool, concurrency)
+
+    # ==============================
+    # Broadcast
+    # ==============================
+    def broadcast(self,
+                  chat_ids: Iterable[Any],
+                  payload: Dict[str, Any],
+                  checkpoint: Optional[str] = None,
+                  concurrency: int = 25,
+                  rate: float = 25,
+                  progress: Optional[Callable[[dict], None]] = None) -> dict:
+        """Send payload ({"method": "send_message", "text": ...}) to every chat.
+
+        Progress is checkpointed to the checkpoint file, so running the
+        same broadcast again resumes where it stopped. Connections past
+        the session's pool_size are not kept alive, raise pool_size for a
+        higher concurrency.
+        """
+        return Broadcast(self, chat_ids, payload, checkpoint, concurrency, rate, progress).run()
 
     # ==============================
     # Gifts and Premium
@@ -1216,17 +1385,12 @@ class Bot:
                 chat_id: int,
                 user_id: int,
                 gift_option: str) -> dict:
-        url = f"https://api.telegram.org/bot{self.token}/sendGift"
         data = {
             "chat_id": chat_id,
             "user_id": user_id,
             "gift_option": gift_option
         }
-        try:
-            return requests.post(url, json=data).json()
-        except Exception as e:
-            print(f"Send gift error: {e}")
-            return {}
+        return self._request("sendGift", data)
 
     # ==============================
     # User Agent and Load Protection
@@ -1234,17 +1398,80 @@ class Bot:
     def set_user_agent(self, user_agent: str):
         """Set custom User-Agent for requests"""
         self.user_agent = user_agent
+        self.session.headers["User-Agent"] = user_agent
 
-    def enable_load_protection(self, max_requests_per_second: int = 30):
-        """Enable rate limiting"""
-        self.max_requests_per_second = max_requests_per_second
-        self.last_request_time = 0
+    def set_upload_progress(self, callback: Optional[Callable[[str, int, Optional[int]], None]]):
+        """callback(method, bytes_sent, total_bytes) is called while uploads stream"""
+        self.upload_progress = callback
 
-    def _check_rate_limit(self):
+    def set_json_codec(self, codec: Union[str, JsonCodec, None] = None) -> JsonCodec:
+        """Use "orjson", "ujson", "json" or a JsonCodec; None picks the fastest installed"""
+        self.codec = codec if isinstance(codec, JsonCodec) else get_codec(codec)
+        return self.codec
+
+    def set_timeouts(self, connect_timeout: float, read_timeout: float):
+        """Set connect/read timeouts used by every request"""
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    def enable_load_protection(self,
+                               max_requests_per_second: float = 30,
+                               private_chat_rate: float = 1,
+                               group_chat_rate: float = 20 / 60):
+        """Enable rate limiting: global, per private chat and per group (calls per second)"""
+        self.rate_limiter = RateLimiter(max_requests_per_second, private_chat_rate, group_chat_rate)
+
+    def disable_load_protection(self):
+        self.rate_limiter = None
+
+    def load_protection_stats(self) -> dict:
+        """Calls made and time spent waiting for the rate limiter"""
+        return self.rate_limiter.stats() if self.rate_limiter else {}
+
+    def set_retry_policy(self, retry_policy: RetryPolicy):
+        """Replace retry policy, RetryPolicy(max_retries=0) disables retries"""
+        self.retry_policy = retry_policy
+
+    def retry_stats(self) -> dict:
+        return dict(self.retry_policy.stats)
+
+    def _check_rate_limit(self, method: str, data: Optional[dict] = None):
         """Internal method for rate limiting"""
-        if hasattr(self, 'max_requests_per_second'):
-            current_time = time.time()
-            time_diff = current_time - self.last_request_time
-            if time_diff < 1 / self.max_requests_per_second:
-                time.sleep(1 / self.max_requests_per_second - time_diff)
-            self.last_request_time = current_time
\ No newline at end of file
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(method, data.get("chat_id") if data else None)
+
+
+def _describe(method: str) -> str:
+    """sendMessage -> Send message"""
+    return re.sub(r'(?<!^)([A-Z])', r' \1', method).capitalize()
+
+
+def _stale_file_id(result: dict) -> bool:
+    """Telegram rejected a cached file_id"""
+    return result.get("error_code") == 400 and "file" in result.get("description", "").lower()
+
+
+def _rewind(files: dict):
+    """Rewind caller's file objects when an upload is retried"""
+    for value in files.values():
+        if hasattr(value, 'seek') and hasattr(value, 'read'):
+            try:
+                value.seek(0)
+            except (OSError, ValueError):
+                pass
+
+
+def _upload_timeout(read_timeout: float, size: Optional[int]) -> float:
+    """Give large uploads time to be received and processed, at least 1 MB/s"""
+    return read_timeout + (size or 0) / UPLOAD_RATE
+
+
+def _form_fields(data: Optional[dict], codec: JsonCodec) -> Optional[dict]:
+    """Multipart fields must be strings, nested values go as JSON"""
+    if not data:
+        return data
+    return {
+        key: value if isinstance(value, (str, bytes))
+        else value.to_json() if hasattr(value, "to_json") else codec.dumps(value)
+        for key, value in data.items()
+    }
@@ -0,0 +1,177 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .ratelimit import TokenBucket
+
+# Statuses written to the checkpoint; "retry" entries are sent again on resume
+SENT = "sent"
+BLOCKED = "blocked"
+DEACTIVATED = "deactivated"
+NOT_FOUND = "not_found"
+FAILED = "failed"
+RETRY = "retry"
+FINAL = {SENT, BLOCKED, DEACTIVATED, NOT_FOUND, FAILED}
+
+
+def classify(response: dict) -> str:
+    """Map a Bot API response to a per-recipient broadcast status"""
+    if response.get("ok"):
+        return SENT
+    if not response:
+        # Network error after all retries
+        return RETRY
+    code = response.get("error_code")
+    description = response.get("description", "").lower()
+    if code == 403:
+        if "deactivated" in description:
+            return DEACTIVATED
+        return BLOCKED
+    if code == 400 and "chat not found" in description:
+        return NOT_FOUND
+    if code == 429 or (code or 0) >= 500:
+        return RETRY
+    return FAILED
+
+
+class Broadcast:
+    """Send one payload to many chats.
+
+    ``payload`` names a Bot method and its arguments except chat_id:
+    ``{"method": "copy_message", "from_chat_id": ..., "message_id": ...}``.
+    Up to ``concurrency`` requests are in flight, paced to ``rate`` messages
+    per second. Each finished recipient is appended to the ``checkpoint``
+    file as ``chat_id<TAB>status``; running again with the same file skips
+    every recipient already recorded with a final status.
+    """
+
+    def __init__(self,
+                 bot,
+                 chat_ids: Iterable[Any],
+                 payload: Dict[str, Any],
+                 checkpoint: Optional[str] = None,
+                 concurrency: int = 25,
+                 rate: float = 25,
+                 progress: Optional[Callable[[dict], None]] = None,
+                 progress_interval: float = 5.0,
+                 flush_interval: float = 1.0):
+        payload = dict(payload)
+        self.send = getattr(bot, payload.pop("method", "send_message"))
+        self.kwargs = payload
+        self.chat_ids = chat_ids
+        self.total = len(chat_ids) if hasattr(chat_ids, "__len__") else None
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate)
+        self.progress = progress or _print_progress
+        self.progress_interval = progress_interval
+        self.flush_interval = flush_interval
+        self.counts = {}
+        self.skipped = 0
+        self._lock = Lock()
+        self._file = None
+        self._flushed = 0.0
+        self._reported = 0.0
+        self._started = 0.0
+
+    def run(self) -> dict:
+        done = self._load_checkpoint()
+        if self.checkpoint:
+            self._file = open(self.checkpoint, "a+", encoding="utf-8")
+            if self._file.tell() > 0:
+                self._file.seek(self._file.tell() - 1)
+                if self._file.read(1) != "\n":
+                    self._file.write("\n")
+        self._started = self._reported = time.monotonic()
+        slots = BoundedSemaphore(self.concurrency * 2)
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                for chat_id in self.chat_ids:
+                    if str(chat_id) in done:
+                        self.skipped += 1
+                        continue
+                    slots.acquire()
+                    pool.submit(self._send_one, chat_id, slots)
+        finally:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+        stats = self.stats()
+        self.progress(stats)
+        return stats
+
+    def _send_one(self, chat_id, slots: BoundedSemaphore):
+        try:
+            self._pace()
+            try:
+                status = classify(self.send(chat_id=chat_id, **self.kwargs))
+            except Exception as e:
+                print(f"Broadcast error: {e}")
+                status = RETRY
+            self._record(chat_id, status)
+        finally:
+            slots.release()
+
+    def _pace(self):
+        with self._lock:
+            now = time.monotonic()
+            at = self.bucket.ready_at(now)
+            self.bucket.consume(at)
+        if at > now:
+            time.sleep(at - now)
+
+    def _record(self, chat_id, status: str):
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+            now = time.monotonic()
+            if self._file is not None:
+                self._file.write(f"{chat_id}\t{status}\n")
+                if now - self._flushed >= self.flush_interval:
+                    self._file.flush()
+                    self._flushed = now
+            report = now - self._reported >= self.progress_interval
+            if report:
+                self._reported = now
+        if report:
+            self.progress(self.stats())
+
+    def _load_checkpoint(self) -> set:
+        done = set()
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return done
+        with open(self.checkpoint, encoding="utf-8") as f:
+            for line in f:
+                chat_id, _, status = line.rstrip("\n").partition("\t")
+                if status in FINAL:
+                    done.add(chat_id)
+                elif status == RETRY:
+                    done.discard(chat_id)
+                # Anything else is a line torn by a crash
+        return done
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        processed = sum(counts.values())
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        throughput = processed / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.total is not None and throughput > 0:
+            eta = max(self.total - self.skipped - processed, 0) / throughput
+        return {
+            "processed": processed,
+            "skipped": self.skipped,
+            "total": self.total,
+            "counts": counts,
+            "throughput": throughput,
+            "eta": eta
+        }
+
+
+def _print_progress(stats: dict):
+    eta = f", ETA {stats['eta']:.0f}s" if stats["eta"] is not None else ""
+    print(f"Broadcast: {stats['processed'] + stats['skipped']}/{stats['total'] or '?'} "
+          f"{stats['throughput']:.1f} msg/s{eta} {stats['counts']}")
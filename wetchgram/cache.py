@@ -0,0 +1,176 @@
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+from typing import Any, Callable, Dict, Optional
+
+# Bot method name -> seconds a successful response stays fresh
+DEFAULT_TTLS = {
+    "get_file": 3000,  # file_path is guaranteed valid for an hour
+    "get_chat": 300,
+    "get_chat_member": 60,
+    "get_chat_administrators": 300
+}
+API_METHODS = {
+    "get_file": "getFile",
+    "get_chat": "getChat",
+    "get_chat_member": "getChatMember",
+    "get_chat_administrators": "getChatAdministrators"
+}
+# Our own calls that change who is a member or admin of a chat
+MEMBER_MUTATIONS = {
+    "promoteChatMember", "restrictChatMember", "banChatMember",
+    "unbanChatMember", "setChatAdministratorCustomTitle"
+}
+
+
+class LookupCache:
+    """Read-through cache for lookup methods.
+
+    Successful responses are kept for their method's TTL in an LRU of
+    ``max_size`` entries. Concurrent identical requests share one call
+    (single flight). Entries of a chat are dropped when a chat_member or
+    my_chat_member update arrives for it, when members join or leave, and
+    after our own promote/restrict/ban calls. Cached responses are shared
+    between callers and must be treated as read-only.
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, max_size: int = 10000):
+        self.ttls = {API_METHODS[name]: ttl for name, ttl in {**DEFAULT_TTLS, **(ttls or {})}.items() if ttl}
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._by_chat = {}
+        self._flights = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def key(self, method: str, data: Optional[dict]) -> Optional[tuple]:
+        """Cache key of a request, None when method is not cached"""
+        if method not in self.ttls or not data:
+            return None
+        if method == "getFile":
+            return method, None, data.get("file_id")
+        return method, data.get("chat_id"), data.get("user_id")
+
+    def fetch(self, key: tuple, load: Callable[[], dict]) -> dict:
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._flights[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return flight.result()
+        result = {}
+        try:
+            result = load()
+        finally:
+            self._land(key, flight, result)
+        return result
+
+    async def fetch_async(self, key: tuple, load: Callable[[], Any]) -> dict:
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._flights[key] = asyncio.get_running_loop().create_future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return await asyncio.shield(flight)
+        result = {}
+        try:
+            result = await load()
+        finally:
+            self._land(key, flight, result)
+        return result
+
+    def _lookup(self, key: tuple) -> Optional[dict]:
+        # Called with the lock held
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._drop(key)
+        return None
+
+    def _land(self, key: tuple, flight, result: dict):
+        with self._lock:
+            # An invalidation while in flight takes the flight out of the map,
+            # its (possibly outdated) result is then not stored
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+                if result.get("ok"):
+                    self._store(key, result)
+        flight.set_result(result)
+
+    def _store(self, key: tuple, value: dict):
+        self._entries[key] = (time.monotonic() + self.ttls[key[0]], value)
+        self._entries.move_to_end(key)
+        if key[1] is not None:
+            self._by_chat.setdefault(key[1], set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: tuple):
+        self._entries.pop(key, None)
+        keys = self._by_chat.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_chat[key[1]]
+
+    def invalidate_chat(self, chat_id: Any, user_id: Optional[int] = None):
+        """Drop cached admins of chat_id and its member user_id (all members when None)"""
+        with self._lock:
+            self.invalidations += 1
+            for key in list(self._by_chat.get(chat_id, ())) + [k for k in self._flights if k[1] == chat_id]:
+                if key[0] == "getChat" and user_id is not None:
+                    continue
+                if key[0] == "getChatMember" and user_id is not None and key[2] != user_id:
+                    continue
+                self._drop(key)
+                self._flights.pop(key, None)
+
+    def after_call(self, method: str, data: Optional[dict], result: dict):
+        if method in MEMBER_MUTATIONS and data and result.get("ok"):
+            self.invalidate_chat(data.get("chat_id"), data.get("user_id"))
+
+    def observe_update(self, update: dict):
+        """Invalidate entries an incoming update makes outdated"""
+        if "my_chat_member" in update:
+            # The bot itself changed status, the chat may look different too
+            self.invalidate_chat(update["my_chat_member"]["chat"]["id"])
+        elif "chat_member" in update:
+            change = update["chat_member"]
+            self.invalidate_chat(change["chat"]["id"], change["new_chat_member"]["user"]["id"])
+        elif "message" in update:
+            message = update["message"]
+            for user in message.get("new_chat_members") or [message.get("left_chat_member")]:
+                if user:
+                    self.invalidate_chat(message["chat"]["id"], user["id"])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "invalidations": self.invalidations,
+                "cached": len(self._entries)
+            }
@@ -0,0 +1,167 @@
+import heapq
+import json
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Condition, Thread
+from typing import Any, Dict, Optional
+
+
+class _Pending:
+    __slots__ = ("method", "kwargs", "signature", "futures", "deadline")
+
+    def __init__(self, method: str, kwargs: dict, signature: str, deadline: float):
+        self.method = method
+        self.kwargs = kwargs
+        self.signature = signature
+        self.futures = []
+        self.deadline = deadline
+
+
+class EditCoalescer:
+    """Coalesce frequent edits of the same message.
+
+    The first edit of a (chat_id, message_id) opens a ``window``; edits
+    arriving inside it replace the pending one and only the latest is sent
+    when it closes. An edit identical to the last one sent is answered
+    locally with that call's result. Every call returns a Future that
+    resolves to the result of the request that finally carried it. Edits of
+    one message never overlap, whatever their method: a text edit followed
+    by a caption edit sends both, in that order, and a window closing while
+    the previous request is in flight waits for it.
+    """
+
+    def __init__(self, bot, window: float = 0.5, workers: int = 4, remember: int = 10000):
+        self.bot = bot
+        self.window = window
+        self.workers = workers
+        self.remember = remember
+        # (chat_id, message_id) -> deque of _Pending, one per run of same-method edits
+        self._pending = {}
+        self._inflight = set()
+        # (chat_id, message_id, method) -> (signature, result) of the last sent edit
+        self._last = OrderedDict()
+        self._heap = []
+        self._cond = Condition()
+        self._closed = False
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self.stats = {"submitted": 0, "sent": 0, "coalesced": 0, "unchanged": 0}
+        Thread(target=self._scheduler, name="wetchgram-edits", daemon=True).start()
+
+    def edit_message(self,
+                     chat_id: int,
+                     message_id: int,
+                     text: str,
+                     reply_markup: Optional[dict] = None) -> Future:
+        return self._submit("edit_message", chat_id, message_id,
+                            {"text": text, "reply_markup": reply_markup})
+
+    def edit_message_caption(self,
+                             chat_id: int,
+                             message_id: int,
+                             caption: Optional[str] = None,
+                             reply_markup: Optional[dict] = None) -> Future:
+        return self._submit("edit_message_caption", chat_id, message_id,
+                            {"caption": caption, "reply_markup": reply_markup})
+
+    def edit_message_media(self,
+                           chat_id: int,
+                           message_id: int,
+                           media: Dict[str, Any],
+                           reply_markup: Optional[dict] = None) -> Future:
+        return self._submit("edit_message_media", chat_id, message_id,
+                            {"media": media, "reply_markup": reply_markup})
+
+    def shutdown(self):
+        """Send what is pending right away, then stop the scheduler and pool"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def _submit(self, method: str, chat_id, message_id, kwargs: dict) -> Future:
+        future = Future()
+        key = (chat_id, message_id)
+        signature = json.dumps(kwargs, sort_keys=True, default=_to_dict)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Edit coalescer is shut down")
+            self.stats["submitted"] += 1
+            queue = self._pending.get(key)
+            pending = queue[-1] if queue else None
+            if pending is not None and pending.method == method:
+                self.stats["coalesced"] += 1
+                pending.kwargs = kwargs
+                pending.signature = signature
+            else:
+                if queue is None:
+                    last = self._last.get((chat_id, message_id, method))
+                    if last is not None and last[0] == signature and key not in self._inflight:
+                        self.stats["unchanged"] += 1
+                        future.set_result(last[1])
+                        return future
+                    queue = self._pending[key] = deque()
+                pending = _Pending(method, kwargs, signature, time.monotonic() + self.window)
+                queue.append(pending)
+                if len(queue) == 1:
+                    heapq.heappush(self._heap, (pending.deadline, key))
+                    self._cond.notify()
+            pending.futures.append(future)
+        return future
+
+    def _scheduler(self):
+        with self._cond:
+            while not (self._closed and not self._pending and not self._inflight):
+                if self._closed:
+                    for key in list(self._pending):
+                        self._start(key)
+                    self._cond.wait()
+                elif not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                else:
+                    _, key = heapq.heappop(self._heap)
+                    self._start(key)
+        self._pool.shutdown(wait=False)
+
+    def _start(self, key):
+        # Called with the lock held; sends the oldest pending edit of key once due
+        queue = self._pending.get(key)
+        while queue and key not in self._inflight and (self._closed or queue[0].deadline <= time.monotonic()):
+            pending = queue.popleft()
+            if queue:
+                heapq.heappush(self._heap, (queue[0].deadline, key))
+            else:
+                del self._pending[key]
+            last = self._last.get((*key, pending.method))
+            if last is not None and last[0] == pending.signature:
+                self.stats["unchanged"] += 1
+                for future in pending.futures:
+                    future.set_result(last[1])
+                continue
+            self._inflight.add(key)
+            self._pool.submit(self._send, key, pending)
+
+    def _send(self, key, pending: _Pending):
+        chat_id, message_id = key
+        try:
+            result = getattr(self.bot, pending.method)(chat_id, message_id, **pending.kwargs)
+        except Exception as e:
+            result = {}
+            print(f"Edit coalescer error: {e}")
+        with self._cond:
+            self.stats["sent"] += 1
+            self._inflight.discard(key)
+            if result.get("ok") or "not modified" in result.get("description", ""):
+                last_key = (chat_id, message_id, pending.method)
+                self._last[last_key] = (pending.signature, result)
+                self._last.move_to_end(last_key)
+                if len(self._last) > self.remember:
+                    self._last.popitem(last=False)
+            # The next window may have closed while this one was in flight
+            self._start(key)
+            self._cond.notify()
+        for future in pending.futures:
+            future.set_result(result)
+
+
+def _to_dict(value):
+    return value.to_dict() if hasattr(value, "to_dict") else str(value)
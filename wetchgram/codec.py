@@ -0,0 +1,94 @@
+import json
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+_PLAIN = {str, int, float, bool, type(None), dict, list}
+
+
+def _default(value: Any) -> Any:
+    # Keyboards and other helpers from wetchgram.types
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class JsonCodec:
+    """JSON to and from bytes.
+
+    ``dumps`` returns the compact UTF-8 encoded body that is sent as is,
+    ``loads`` takes the raw response bytes. Objects with ``to_dict()``
+    (the keyboards in wetchgram.types) are encoded through it.
+    """
+
+    def __init__(self, name: str, dumps: Callable[[Any], bytes], loads: Callable[[Union[bytes, str]], Any]):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def dumps_request(self, data: dict) -> bytes:
+        """dumps for a request body; top-level values with a cached
+        to_json() (markups from wetchgram.types) are spliced in as is"""
+        rest = data
+        spliced = b""
+        for key, value in data.items():
+            if type(value) in _PLAIN or not hasattr(value, "to_json"):
+                continue
+            if rest is data:
+                rest = dict(data)
+            del rest[key]
+            # Parameter names are plain ASCII, no escaping needed
+            spliced += b',"' + key.encode() + b'":' + value.to_json()
+        if rest is data:
+            return self.dumps(data)
+        body = self.dumps(rest)
+        return body[:-1] + (spliced if len(body) > 2 else spliced[1:]) + b"}"
+
+    def __repr__(self) -> str:
+        return f"JsonCodec({self.name!r})"
+
+
+def _orjson() -> JsonCodec:
+    return JsonCodec("orjson", lambda obj: orjson.dumps(obj, default=_default), orjson.loads)
+
+
+def _ujson() -> JsonCodec:
+    def dumps(obj: Any) -> bytes:
+        try:
+            return ujson.dumps(obj, ensure_ascii=False, default=_default).encode()
+        except TypeError:
+            # ujson older than 5.4 has no default=
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+    return JsonCodec("ujson", dumps, ujson.loads)
+
+
+def _stdlib() -> JsonCodec:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+    return JsonCodec("json", dumps, json.loads)
+
+
+CODECS = {"orjson": (lambda: orjson, _orjson), "ujson": (lambda: ujson, _ujson), "json": (lambda: json, _stdlib)}
+
+
+def get_codec(name: Optional[str] = None) -> JsonCodec:
+    """Named codec, or the fastest installed one: orjson, ujson, json"""
+    if name is not None:
+        if name not in CODECS:
+            raise ValueError(f"Unknown JSON codec {name!r}, expected one of {', '.join(CODECS)}")
+        module, build = CODECS[name]
+        if module() is None:
+            raise ImportError(f"{name} is not installed")
+        return build()
+    for module, build in CODECS.values():
+        if module() is not None:
+            return build()
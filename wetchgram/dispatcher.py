@@ -0,0 +1,399 @@
+import asyncio
+import time
+from collections import deque
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, Dict, Optional, Sequence
+
+
+def update_type(update: dict) -> Optional[str]:
+    """message, callback_query, inline_query, ..."""
+    for kind in update:
+        if kind != "update_id":
+            return kind
+    return None
+
+
+# Update types whose payload is a Message
+MESSAGE_UPDATES = frozenset({
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "business_message", "edited_business_message"
+})
+CONTENT_TYPES = frozenset({
+    "text", "animation", "audio", "document", "paid_media", "photo", "sticker", "story",
+    "video", "video_note", "voice", "contact", "dice", "game", "poll", "venue", "location",
+    "invoice", "successful_payment", "refunded_payment", "users_shared", "chat_shared",
+    "new_chat_members", "left_chat_member", "new_chat_title", "new_chat_photo",
+    "delete_chat_photo", "group_chat_created", "supergroup_chat_created",
+    "migrate_to_chat_id", "migrate_from_chat_id", "pinned_message", "web_app_data",
+    "forum_topic_created", "forum_topic_closed", "forum_topic_reopened",
+    "giveaway", "giveaway_winners", "video_chat_started", "video_chat_ended"
+})
+
+
+# Lane name -> update types, in priority order; everything else runs in "default".
+# Payments have 10 seconds to be answered, callbacks and inline queries keep a user waiting
+DEFAULT_LANES = {
+    "payments": ("pre_checkout_query", "shipping_query"),
+    "interactive": ("callback_query", "inline_query")
+}
+
+
+def content_type(message: dict) -> Optional[str]:
+    """text, photo, document, voice, ... of a message"""
+    for key in message:
+        if key in CONTENT_TYPES:
+            # Animations come with a document field as well
+            if key == "document" and "animation" in message:
+                return "animation"
+            return key
+    return None
+
+
+def update_key(update: dict) -> Any:
+    """Ordering key of an update: chat_id, else user_id, else the update itself"""
+    for kind, payload in update.items():
+        if kind == "update_id" or not isinstance(payload, dict):
+            continue
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = payload.get("from") or payload.get("user")
+        if user:
+            return user["id"]
+    return ("update", update.get("update_id"))
+
+
+class _Lane:
+    __slots__ = ("name", "ready", "cond", "waits", "wait_total", "wait_max")
+
+    def __init__(self, name: str, lock: Lock):
+        self.name = name
+        self.ready = deque()
+        # Wakes the workers reserved for this lane
+        self.cond = Condition(lock)
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class _Shard:
+    __slots__ = ("lock", "queues")
+
+    def __init__(self):
+        self.lock = Lock()
+        self.queues = {}
+
+
+class Dispatcher:
+    """Per-chat ordered, cross-chat parallel update dispatch.
+
+    Every key (chat, or user when there is no chat) has its own FIFO. A key
+    with pending updates sits once in the ready queue; a worker takes it,
+    runs the oldest update and puts the key back at the tail if more are
+    waiting. So one chat never runs two updates at once or out of order,
+    while a busy chat only ever occupies one worker. Key queues are spread
+    over ``shards`` locks to keep submit contention low.
+
+    At most ``max_pending`` updates are queued; ``wait_for_capacity`` lets
+    the intake pause until workers catch up. ``shed_policy`` maps update
+    types to a maximum age in seconds: older updates are dropped when a
+    worker reaches them instead of answering minutes late. The age is
+    taken from the message ``date`` when there is one, otherwise from the
+    moment the update was received. ``on_done`` is called once the handler
+    of an update returned or the update was shed.
+
+    Ready keys wait in priority ``lanes`` (name -> update types, highest
+    priority first, see DEFAULT_LANES; the rest go to "default"). A key is
+    placed by the type of its oldest update, so a callback query jumps
+    ahead of other chats' messages but still runs after earlier updates of
+    its own chat. Workers always serve the highest non-empty lane;
+    ``reserved`` adds workers that serve only their lane (name -> count),
+    so that lane keeps moving while the shared workers sit in slow
+    handlers. ``stats()`` reports the queue wait per lane.
+    """
+
+    def __init__(self,
+                 handle: Callable[[dict], None],
+                 workers: int = 4,
+                 shards: int = 64,
+                 max_queue_per_key: int = 1000,
+                 max_pending: int = 10000,
+                 shed_policy: Optional[Dict[str, float]] = None,
+                 on_done: Optional[Callable[[dict], None]] = None,
+                 lanes: Optional[Dict[str, Sequence[str]]] = None,
+                 reserved: Optional[Dict[str, int]] = None):
+        self.handle = handle
+        self.on_done = on_done
+        self.workers = workers
+        self.max_queue_per_key = max_queue_per_key
+        self.max_pending = max_pending
+        self.shed_policy = shed_policy or {}
+        self._shards = [_Shard() for _ in range(shards)]
+        lock = Lock()
+        self._cond = Condition(lock)
+        lanes = DEFAULT_LANES if lanes is None else lanes
+        self._lanes = [_Lane(name, lock) for name in (*lanes, "default")]
+        self._lane_of = {kind: i for i, kinds in enumerate(lanes.values()) for kind in kinds}
+        self._default_lane = len(self._lanes) - 1
+        names = [lane.name for lane in self._lanes]
+        for name in reserved or {}:
+            if name not in names:
+                raise ValueError(f"Unknown lane {name!r}, expected one of {', '.join(names)}")
+        self.reserved = dict(reserved or {})
+        self._capacity = Condition()
+        self._pending = 0
+        self._threads = []
+        self._running = False
+        self.dropped = 0
+        self.shed = {}
+        self.started = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        for i in range(self.workers):
+            thread = Thread(target=self._worker, name=f"wetchgram-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        for index, lane in enumerate(self._lanes):
+            for i in range(self.reserved.get(lane.name, 0)):
+                thread = Thread(target=self._worker, args=(index,),
+                                name=f"wetchgram-{lane.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+            for lane in self._lanes:
+                lane.cond.notify_all()
+        self._threads = []
+
+    def submit(self, update: dict) -> bool:
+        """Queue update behind earlier ones of the same key, False if dropped"""
+        key = update_key(update)
+        item = (update, time.monotonic(), time.time())
+        shard = self._shards[hash(key) % len(self._shards)]
+        with shard.lock:
+            queue = shard.queues.get(key)
+            if queue is not None and len(queue) >= self.max_queue_per_key:
+                self.dropped += 1
+                return False
+            with self._capacity:
+                self._pending += 1
+            if queue is not None:
+                # Key is already scheduled, its worker will get to it
+                queue.append(item)
+                return True
+            shard.queues[key] = deque((item,))
+        self._schedule(key, update)
+        return True
+
+    def wait_for_capacity(self, timeout: Optional[float] = None) -> bool:
+        """Block while max_pending updates are queued, False on timeout"""
+        with self._capacity:
+            return self._capacity.wait_for(lambda: self._pending < self.max_pending, timeout)
+
+    def _lane(self, update: dict) -> int:
+        return self._lane_of.get(update_type(update), self._default_lane)
+
+    def _schedule(self, key, update: dict):
+        # update is the oldest queued one of key, it picks the lane
+        lane = self._lanes[self._lane(update)]
+        with self._cond:
+            lane.ready.append(key)
+            self._cond.notify()
+            if self.reserved.get(lane.name):
+                lane.cond.notify()
+
+    def _ready_lane(self, reserved_lane: Optional[int]) -> Optional[_Lane]:
+        # Called with the lock held, None when nothing is ready
+        if reserved_lane is not None:
+            lane = self._lanes[reserved_lane]
+            return lane if lane.ready else None
+        for lane in self._lanes:
+            if lane.ready:
+                return lane
+        return None
+
+    def _worker(self, reserved_lane: Optional[int] = None):
+        cond = self._cond if reserved_lane is None else self._lanes[reserved_lane].cond
+        while True:
+            with cond:
+                lane = self._ready_lane(reserved_lane)
+                while lane is None and self._running:
+                    cond.wait()
+                    lane = self._ready_lane(reserved_lane)
+                if not self._running:
+                    return
+                key = lane.ready.popleft()
+
+            update, shed = self._begin(key)
+            if not shed:
+                try:
+                    self.handle(update)
+                except Exception as e:
+                    print(f"Dispatch error: {e}")
+            self._end(key, update, shed)
+
+    def _begin(self, key) -> tuple:
+        """Oldest update of a key taken off the ready queue, and whether it is shed"""
+        shard = self._shards[hash(key) % len(self._shards)]
+        with shard.lock:
+            update, received, received_at = shard.queues[key][0]
+        shed = self._should_shed(update, received_at)
+        if not shed:
+            latency = time.monotonic() - received
+            lane = self._lanes[self._lane(update)]
+            with self._capacity:
+                self.started += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+                lane.waits += 1
+                lane.wait_total += latency
+                lane.wait_max = max(lane.wait_max, latency)
+        return update, shed
+
+    def _end(self, key, update: dict, shed: bool):
+        """Release a handled or shed update and schedule the key's next one"""
+        with self._capacity:
+            if shed:
+                kind = update_type(update)
+                self.shed[kind] = self.shed.get(kind, 0) + 1
+            self._pending -= 1
+            self._capacity.notify()
+        if self.on_done is not None:
+            self.on_done(update)
+        shard = self._shards[hash(key) % len(self._shards)]
+        with shard.lock:
+            queue = shard.queues[key]
+            queue.popleft()
+            if not queue:
+                del shard.queues[key]
+                return
+            update = queue[0][0]
+        self._schedule(key, update)
+
+    def _should_shed(self, update: dict, received_at: float) -> bool:
+        if not self.shed_policy:
+            return False
+        kind = update_type(update)
+        max_age = self.shed_policy.get(kind)
+        if max_age is None:
+            return False
+        date = update[kind].get("date") if isinstance(update[kind], dict) else None
+        return time.time() - (date or received_at) > max_age
+
+    def pending(self) -> int:
+        return self._pending
+
+    def stats(self) -> dict:
+        return {
+            "ready_keys": sum(len(lane.ready) for lane in self._lanes),
+            "pending": self._pending,
+            "dropped": self.dropped,
+            "shed": dict(self.shed),
+            "started": self.started,
+            "latency_avg": self.latency_total / self.started if self.started else 0.0,
+            "latency_max": self.latency_max,
+            "lanes": {
+                lane.name: {
+                    "ready_keys": len(lane.ready),
+                    "started": lane.waits,
+                    "wait_avg": lane.wait_total / lane.waits if lane.waits else 0.0,
+                    "wait_max": lane.wait_max
+                } for lane in self._lanes
+            }
+        }
+
+
+class AsyncDispatcher(Dispatcher):
+    """Dispatcher on an event loop, used by AsyncBot.
+
+    Same per-key order, lanes, reserved workers, shedding, ``max_pending``
+    and stats; the workers are tasks awaiting the coroutine ``handle``,
+    so ``workers`` bounds how many handlers run at once. submit() and
+    wait_for_capacity() must be called on the loop.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tasks = []
+        self._wake = None
+        self._lane_wake = []
+        self._room = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        # Created here, bound to the loop the bot runs on
+        self._wake = asyncio.Event()
+        self._lane_wake = [asyncio.Event() for _ in self._lanes]
+        self._room = asyncio.Event()
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.ensure_future(self._worker()))
+        for index, lane in enumerate(self._lanes):
+            for _ in range(self.reserved.get(lane.name, 0)):
+                self._tasks.append(asyncio.ensure_future(self._worker(index)))
+
+    def stop(self):
+        # Idle workers exit, running handlers finish
+        self._running = False
+        if self._wake is not None:
+            self._wake.set()
+            for wake in self._lane_wake:
+                wake.set()
+            self._room.set()
+        self._tasks = []
+
+    async def wait_for_capacity(self, timeout: Optional[float] = None) -> bool:
+        """Wait while max_pending updates are queued, False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._pending >= self.max_pending and self._running:
+            self._room.clear()
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._room.wait(), remaining)
+            except asyncio.TimeoutError:
+                return self._pending < self.max_pending
+        return True
+
+    def _schedule(self, key, update: dict):
+        index = self._lane(update)
+        lane = self._lanes[index]
+        lane.ready.append(key)
+        self._wake.set()
+        if self.reserved.get(lane.name):
+            self._lane_wake[index].set()
+
+    async def _worker(self, reserved_lane: Optional[int] = None):
+        wake = self._wake if reserved_lane is None else self._lane_wake[reserved_lane]
+        while True:
+            lane = self._ready_lane(reserved_lane)
+            while lane is None and self._running:
+                # No await between the check and clear(), a schedule cannot slip in
+                wake.clear()
+                await wake.wait()
+                lane = self._ready_lane(reserved_lane)
+            if not self._running:
+                return
+            key = lane.ready.popleft()
+            update, shed = self._begin(key)
+            if not shed:
+                try:
+                    await self.handle(update)
+                except Exception as e:
+                    print(f"Dispatch error: {e}")
+            self._end(key, update, shed)
+
+    def _end(self, key, update: dict, shed: bool):
+        super()._end(key, update, shed)
+        self._room.set()
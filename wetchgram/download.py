@@ -0,0 +1,420 @@
+import asyncio
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from threading import Lock
+from typing import Any, Iterable, Iterator, Optional, Tuple
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+CHUNK_SIZE = 256 * 1024
+SEGMENT_THRESHOLD = 8 * 1024 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+class _RangeIgnored(DownloadError):
+    pass
+
+
+class Downloader:
+    """Chunked file downloads with Range resume.
+
+    A path destination is written to ``<path>.part`` and renamed into
+    place only when complete (and, with ``expected_size``, of the right
+    size); a ``.part`` left by an interrupted run is resumed with a Range
+    request. Large files (``segment_threshold``) on a server that accepts
+    ranges are fetched in ``segments`` parallel pieces. Every piece that
+    fails mid-way is retried from the last byte received; their ``.part``
+    is pre-sized, so one left by an interrupted segmented run is
+    discarded rather than resumed. In-memory
+    destinations (BytesIO or other writable file objects, bytearray,
+    memoryview) skip the disk entirely.
+    """
+
+    def __init__(self,
+                 session: requests.Session,
+                 timeout: Tuple[float, float],
+                 chunk_size: int = CHUNK_SIZE,
+                 segments: int = 4,
+                 segment_threshold: int = SEGMENT_THRESHOLD,
+                 max_retries: int = 3):
+        self.session = session
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.segments = segments
+        self.segment_threshold = segment_threshold
+        self.max_retries = max_retries
+
+    def download(self, url: str, destination: Any, expected_size: Optional[int] = None) -> int:
+        """Download url into destination, return number of bytes"""
+        if isinstance(destination, str):
+            return self._to_path(url, destination, expected_size)
+        size, ranges = self._probe(url, expected_size)
+        if isinstance(destination, bytearray) and size is not None and len(destination) < size:
+            destination.extend(bytes(size - len(destination)))
+        sink = _MemorySink(destination)
+        if sink.positional and self._parallel(size, ranges):
+            self._fetch_segments(url, sink, size)
+        else:
+            size = self._fetch(url, sink, 0, None, size)
+        if isinstance(destination, bytearray):
+            del destination[size:]
+        _verify(size, expected_size)
+        return size
+
+    def _to_path(self, url: str, path: str, expected_size: Optional[int]) -> int:
+        part, segmented, resume_from = _open_part(path)
+        size, ranges = self._probe(url, expected_size)
+
+        if resume_from == 0 and self._parallel(size, ranges):
+            sink = _presize(part, segmented, size)
+            try:
+                self._fetch_segments(url, sink, size)
+            except BaseException:
+                _discard(sink, part, segmented)
+                raise
+            sink.close()
+            os.remove(segmented)
+            received = size
+        else:
+            resume_from = _resume_point(resume_from, size, ranges)
+            sink = _FileSink(part, truncate_at=resume_from)
+            try:
+                received = self._fetch(url, sink, resume_from, None, size)
+            finally:
+                sink.close()
+
+        _verify(received, expected_size)
+        os.replace(part, path)
+        return received
+
+    def _probe(self, url: str, expected_size: Optional[int]) -> Tuple[Optional[int], bool]:
+        """(size, server accepts ranges)"""
+        try:
+            response = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+            response.raise_for_status()
+        except requests.RequestException:
+            return expected_size, False
+        length = response.headers.get("Content-Length")
+        size = int(length) if length and length.isdigit() else expected_size
+        return size, response.headers.get("Accept-Ranges") == "bytes"
+
+    def _parallel(self, size: Optional[int], ranges: bool) -> bool:
+        return ranges and self.segments > 1 and size is not None and size >= self.segment_threshold
+
+    def _fetch_segments(self, url: str, sink, size: int):
+        step = -(-size // self.segments)
+        bounds = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+        with ThreadPoolExecutor(max_workers=len(bounds)) as pool:
+            for future in [pool.submit(self._fetch, url, sink, start, end, size) for start, end in bounds]:
+                future.result()
+
+    def _fetch(self, url: str, sink, start: int, end: Optional[int], size: Optional[int]) -> int:
+        """Fetch bytes start..end (inclusive, None = to EOF) into sink, resuming on errors"""
+        position = start
+        attempt = 0
+        while True:
+            headers = _range(position, end)
+            try:
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code == 416 and end is None and position == size:
+                        return position
+                    response.raise_for_status()
+                    if _restarted(headers, response.status_code, start, end):
+                        position = 0
+                        sink.truncate(0)
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        sink.write_at(position, chunk)
+                        position += len(chunk)
+                if end is None or position > end:
+                    return position
+                raise DownloadError("segment ended early")
+            except _RangeIgnored:
+                raise
+            except (requests.RequestException, DownloadError):
+                attempt += 1
+                delay = self._backoff(attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    def _backoff(self, attempt: int) -> Optional[float]:
+        """Seconds before retrying a broken piece, None once max_retries are used up"""
+        return None if attempt > self.max_retries else min(2 ** attempt * 0.5, 10)
+
+
+class AsyncDownloader(Downloader):
+    """Downloader for AsyncBot: the same ``.part`` resume, segments and
+    retries from the last byte, over an aiohttp session and awaited.
+    ``timeout`` is an aiohttp.ClientTimeout.
+    """
+
+    async def download(self, url: str, destination: Any, expected_size: Optional[int] = None) -> int:
+        """Download url into destination, return number of bytes"""
+        if isinstance(destination, str):
+            return await self._to_path(url, destination, expected_size)
+        size, ranges = await self._probe(url, expected_size)
+        if isinstance(destination, bytearray) and size is not None and len(destination) < size:
+            destination.extend(bytes(size - len(destination)))
+        sink = _MemorySink(destination)
+        if sink.positional and self._parallel(size, ranges):
+            await self._fetch_segments(url, sink, size)
+        else:
+            size = await self._fetch(url, sink, 0, None, size)
+        if isinstance(destination, bytearray):
+            del destination[size:]
+        _verify(size, expected_size)
+        return size
+
+    async def _to_path(self, url: str, path: str, expected_size: Optional[int]) -> int:
+        part, segmented, resume_from = _open_part(path)
+        size, ranges = await self._probe(url, expected_size)
+
+        if resume_from == 0 and self._parallel(size, ranges):
+            sink = _presize(part, segmented, size)
+            try:
+                await self._fetch_segments(url, sink, size)
+            except BaseException:
+                _discard(sink, part, segmented)
+                raise
+            sink.close()
+            os.remove(segmented)
+            received = size
+        else:
+            resume_from = _resume_point(resume_from, size, ranges)
+            sink = _FileSink(part, truncate_at=resume_from)
+            try:
+                received = await self._fetch(url, sink, resume_from, None, size)
+            finally:
+                sink.close()
+
+        _verify(received, expected_size)
+        os.replace(part, path)
+        return received
+
+    async def _probe(self, url: str, expected_size: Optional[int]) -> Tuple[Optional[int], bool]:
+        try:
+            async with self.session.head(url, timeout=self.timeout, allow_redirects=True) as response:
+                response.raise_for_status()
+                headers = response.headers
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return expected_size, False
+        length = headers.get("Content-Length")
+        size = int(length) if length and length.isdigit() else expected_size
+        return size, headers.get("Accept-Ranges") == "bytes"
+
+    async def _fetch_segments(self, url: str, sink, size: int):
+        step = -(-size // self.segments)
+        tasks = [asyncio.ensure_future(self._fetch(url, sink, start, min(start + step, size) - 1, size))
+                 for start in range(0, size, step)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # No piece may write into the sink once it is closed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _fetch(self, url: str, sink, start: int, end: Optional[int], size: Optional[int]) -> int:
+        position = start
+        attempt = 0
+        while True:
+            headers = _range(position, end)
+            try:
+                async with self.session.get(url, headers=headers, timeout=self.timeout) as response:
+                    if response.status == 416 and end is None and position == size:
+                        return position
+                    response.raise_for_status()
+                    if _restarted(headers, response.status, start, end):
+                        position = 0
+                        sink.truncate(0)
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        sink.write_at(position, chunk)
+                        position += len(chunk)
+                if end is None or position > end:
+                    return position
+                raise DownloadError("segment ended early")
+            except _RangeIgnored:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError, DownloadError):
+                attempt += 1
+                delay = self._backoff(attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+
+def _open_part(path: str) -> Tuple[str, str, int]:
+    """(.part path, segments marker path, bytes to resume from)"""
+    part = path + ".part"
+    # Marks a .part pre-sized for segments: its holes make its size meaningless
+    segmented = part + ".segments"
+    if os.path.exists(segmented):
+        for leftover in (part, segmented):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return part, segmented, os.path.getsize(part) if os.path.exists(part) else 0
+
+
+def _presize(part: str, segmented: str, size: int) -> "_FileSink":
+    open(segmented, "wb").close()
+    with open(part, "wb") as f:
+        f.truncate(size)
+    return _FileSink(part)
+
+
+def _discard(sink: "_FileSink", part: str, segmented: str):
+    sink.close()
+    os.remove(part)
+    os.remove(segmented)
+
+
+def _resume_point(resume_from: int, size: Optional[int], ranges: bool) -> int:
+    if resume_from and (not ranges or (size is not None and resume_from > size)):
+        return 0
+    return resume_from
+
+
+def _range(position: int, end: Optional[int]) -> dict:
+    if position or end is not None:
+        return {"Range": f"bytes={position}-{'' if end is None else end}"}
+    return {}
+
+
+def _restarted(headers: dict, status: int, start: int, end: Optional[int]) -> bool:
+    """True when a Range request got the whole file: start over, or fail for a piece"""
+    if not headers or status == 206:
+        return False
+    if start or end is not None:
+        raise _RangeIgnored("server ignored Range request")
+    return True
+
+
+def _verify(received: int, expected_size: Optional[int]):
+    if expected_size is not None and received != expected_size:
+        raise DownloadError(f"size mismatch: got {received} bytes, expected {expected_size}")
+
+
+class _FileSink:
+    """Positional, lock-protected writes into a file"""
+
+    def __init__(self, path: str, truncate_at: Optional[int] = None):
+        self._file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        if truncate_at is not None:
+            self._file.truncate(truncate_at)
+        self._lock = Lock()
+
+    def write_at(self, offset: int, chunk: bytes):
+        with self._lock:
+            self._file.seek(offset)
+            self._file.write(chunk)
+
+    def truncate(self, size: int):
+        with self._lock:
+            self._file.truncate(size)
+
+    def close(self):
+        self._file.close()
+
+
+class _MemorySink:
+    """Positional writes into bytearray, memoryview or a writable file object"""
+
+    def __init__(self, target: Any):
+        self.target = target
+        self._lock = Lock()
+        self.buffer = isinstance(target, (bytearray, memoryview))
+        self.positional = self.buffer or (hasattr(target, "seekable") and target.seekable())
+        # File objects are written from where the caller left them
+        self.base = target.tell() if self.positional and not self.buffer else 0
+
+    def write_at(self, offset: int, chunk: bytes):
+        with self._lock:
+            target = self.target
+            if self.buffer:
+                end = offset + len(chunk)
+                if isinstance(target, bytearray) and end > len(target):
+                    target.extend(bytes(end - len(target)))
+                target[offset:end] = chunk
+            else:
+                if self.positional:
+                    target.seek(self.base + offset)
+                target.write(chunk)
+
+    def truncate(self, size: int):
+        with self._lock:
+            if isinstance(self.target, bytearray):
+                del self.target[size:]
+            elif not self.buffer and self.positional:
+                self.target.seek(self.base + size)
+                self.target.truncate(self.base + size)
+
+
+def download_many(bot, files: Iterable[Any], dest_dir: str, pool: ThreadPoolExecutor,
+                  concurrency: int) -> Iterator[dict]:
+    """Resolve and download files on pool, at most concurrency at a time,
+    yielding one result per distinct file_unique_id as each completes"""
+    os.makedirs(dest_dir, exist_ok=True)
+    seen = set()
+    lock = Lock()
+
+    def claim(unique_id: str) -> bool:
+        with lock:
+            if unique_id in seen:
+                return False
+            seen.add(unique_id)
+            return True
+
+    def fetch(file_id: str, unique_id: Optional[str]) -> Optional[dict]:
+        result = {"file_id": file_id, "file_unique_id": unique_id, "path": None, "ok": False, "error": None}
+        response = bot.get_file(file_id)
+        info = response.get("result") if response.get("ok") else None
+        if not info or not info.get("file_path"):
+            result["error"] = response.get("description", "getFile failed")
+            return result
+        if unique_id is None:
+            unique_id = result["file_unique_id"] = info.get("file_unique_id", file_id)
+            if not claim(unique_id):
+                return None
+        path = os.path.join(dest_dir, unique_id + os.path.splitext(info["file_path"])[1])
+        if bot.download_file(info["file_path"], path, expected_size=info.get("file_size")):
+            result.update(ok=True, path=path)
+        else:
+            result["error"] = "download failed"
+        return result
+
+    def task(file_id: str, unique_id: Optional[str]) -> Optional[dict]:
+        try:
+            return fetch(file_id, unique_id)
+        except Exception as e:
+            return {"file_id": file_id, "file_unique_id": unique_id, "path": None, "ok": False, "error": str(e)}
+
+    running = set()
+    for item in files:
+        file_id = item["file_id"] if isinstance(item, dict) else item
+        unique_id = item.get("file_unique_id") if isinstance(item, dict) else None
+        # Without a file_unique_id the same file_id is still only fetched once
+        if not claim(unique_id or file_id):
+            continue
+        if len(running) >= concurrency:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            yield from _results(done)
+        running.add(pool.submit(task, file_id, unique_id))
+    for future in as_completed(running):
+        yield from _results([future])
+
+
+def _results(futures) -> Iterator[dict]:
+    for future in futures:
+        result = future.result()
+        if result is not None:
+            yield result
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import sqlite3
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+
+class FileIdCache:
+    """Maps local files to the file_id Telegram returned for them.
+
+    A file is identified by path + mtime + size, or by the SHA-256 of its
+    content with ``hash_content=True`` (then copies of a file share one
+    upload). Either way a modified file gets a new key, so stale ids are
+    never used. Entries live in an in-memory LRU of ``max_size`` and,
+    when ``path`` is given, in an SQLite file that survives restarts.
+    """
+
+    def __init__(self, max_size: int = 1024, path: Optional[str] = None, hash_content: bool = False):
+        self.max_size = max_size
+        self.path = path
+        self.hash_content = hash_content
+        self._memory = OrderedDict()
+        self._hashes = OrderedDict()
+        self._lock = Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS file_ids (key TEXT PRIMARY KEY, file_id TEXT)")
+            self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, file_path: str) -> str:
+        st = os.stat(file_path)
+        stat_key = f"{os.path.abspath(file_path)}:{st.st_mtime_ns}:{st.st_size}"
+        if not self.hash_content:
+            return stat_key
+        with self._lock:
+            digest = self._hashes.get(stat_key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(chunk)
+            digest = f"sha256:{sha.hexdigest()}"
+            with self._lock:
+                self._hashes[stat_key] = digest
+                if len(self._hashes) > self.max_size:
+                    self._hashes.popitem(last=False)
+        return digest
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            file_id = self._memory.get(key)
+            if file_id is None and self._db is not None:
+                row = self._db.execute("SELECT file_id FROM file_ids WHERE key = ?", (key,)).fetchone()
+                if row:
+                    file_id = row[0]
+                    self._remember(key, file_id)
+            elif file_id is not None:
+                self._memory.move_to_end(key)
+            if file_id is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return file_id
+
+    def put(self, key: str, file_id: str):
+        with self._lock:
+            self._remember(key, file_id)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO file_ids VALUES (?, ?)", (key, file_id))
+                self._db.commit()
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM file_ids WHERE key = ?", (key,))
+                self._db.commit()
+
+    def _remember(self, key: str, file_id: str):
+        self._memory[key] = file_id
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def prepare(self, data: Optional[dict], files: dict, use_cache: bool = True) -> Tuple[dict, dict, Dict[str, str], Dict[str, str]]:
+        """Swap cached local paths for file_ids.
+
+        Returns (data, files to upload, keys served from cache, keys of
+        uploaded paths to remember once the response is in).
+        """
+        data = dict(data or {})
+        upload = {}
+        used = {}
+        uploads = {}
+        for field, value in files.items():
+            if isinstance(value, str):
+                try:
+                    key = self.key(value)
+                except OSError:
+                    # A file_id or missing path: the upload reports it as without the cache
+                    upload[field] = value
+                    continue
+                file_id = self.get(key) if use_cache else None
+                if file_id is not None:
+                    data[field] = file_id
+                    used[field] = key
+                    continue
+                uploads[field] = key
+            upload[field] = value
+        return data, upload, used, uploads
+
+    def remember(self, uploads: Dict[str, str], response: dict):
+        if not uploads or not response.get("ok"):
+            return
+        result = response.get("result")
+        if not isinstance(result, dict):
+            return
+        for field, key in uploads.items():
+            file_id = extract_file_id(result, field)
+            if file_id:
+                self.put(key, file_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "cached": len(self._memory)}
+
+
+def extract_file_id(message: dict, field: str) -> Optional[str]:
+    """file_id of the media sent in field (largest size for photos)"""
+    media = message.get(field)
+    if media is None and field in ("video", "document"):
+        # Telegram may turn videos and documents into animations
+        media = message.get("animation") or message.get("document")
+    if isinstance(media, list):
+        media = media[-1] if media else None
+    if isinstance(media, dict):
+        return media.get("file_id")
+    return None
@@ -0,0 +1,190 @@
+from typing import Any, Optional
+
+# Bot API keys that are not valid attribute names
+_RENAMED = {"from_user": "from"}
+
+
+class _Nested:
+    """Nested field kept as the raw dict/list and parsed into a model on first access"""
+
+    __slots__ = ("model", "slot")
+
+    def __init__(self, model: str):
+        self.model = model
+        self.slot = None
+
+    def __set_name__(self, owner, name: str):
+        self.slot = "_" + name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if isinstance(value, (dict, list)):
+            model = globals()[self.model]
+            value = tuple(model(item) for item in value) if isinstance(value, list) else model(value)
+            setattr(obj, self.slot, value)
+        return value
+
+
+class Model:
+    """Compact read-only view of a Bot API object.
+
+    Known fields live in ``__slots__`` instead of a per-object dict;
+    nested objects stay raw until their attribute is first read. Missing
+    fields read as None and fields this library does not know yet are
+    still reachable as attributes, by ``obj["key"]`` and in ``raw``.
+    """
+
+    __slots__ = ("_extra",)
+    _keys = {}
+
+    def __init_subclass__(cls):
+        super().__init_subclass__()
+        # Bot API key -> slot
+        cls._keys = {**cls._keys}
+        for slot in cls.__dict__.get("__slots__", ()):
+            name = slot.lstrip("_")
+            cls._keys[_RENAMED.get(name, name)] = slot
+
+    def __init__(self, raw: dict):
+        keys = self._keys
+        extra = None
+        for key, value in raw.items():
+            slot = keys.get(key)
+            if slot is not None:
+                setattr(self, slot, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self._extra = extra
+
+    def __getattr__(self, name: str):
+        # Only reached for unset slots and unknown names
+        if name.startswith("__") or name == "_extra":
+            raise AttributeError(name)
+        if self._extra is not None and name in self._extra:
+            return self._extra[name]
+        if name in self._keys.values() or _RENAMED.get(name, name) in self._keys:
+            return None
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    def _attribute(self, key: str) -> str:
+        slot = self._keys[key]
+        return slot.lstrip("_") if slot.startswith("_") else slot
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._keys:
+            value = getattr(self, self._attribute(key))
+            if value is not None:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    @property
+    def raw(self) -> dict:
+        """The object as a Bot API dict"""
+        data = {}
+        for key, slot in self._keys.items():
+            try:
+                value = object.__getattribute__(self, slot)
+            except AttributeError:
+                continue
+            if isinstance(value, Model):
+                value = value.raw
+            elif isinstance(value, tuple):
+                value = [item.raw if isinstance(item, Model) else item for item in value]
+            data[key] = value
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    def __reduce__(self):
+        return type(self), (self.raw,)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.raw!r})"
+
+
+class User(Model):
+    __slots__ = ("id", "is_bot", "first_name", "last_name", "username", "language_code", "is_premium")
+
+
+class Chat(Model):
+    __slots__ = ("id", "type", "title", "username", "first_name", "last_name", "is_forum")
+
+
+class MessageEntity(Model):
+    __slots__ = ("type", "offset", "length", "url", "_user", "language", "custom_emoji_id")
+    user = _Nested("User")
+
+
+class PhotoSize(Model):
+    __slots__ = ("file_id", "file_unique_id", "width", "height", "file_size")
+
+
+class Message(Model):
+    __slots__ = (
+        "message_id", "message_thread_id", "date", "edit_date", "text", "caption",
+        "media_group_id", "_from_user", "_sender_chat", "_chat", "_reply_to_message",
+        "_entities", "_caption_entities", "_photo"
+    )
+    from_user = _Nested("User")
+    sender_chat = _Nested("Chat")
+    chat = _Nested("Chat")
+    reply_to_message = _Nested("Message")
+    entities = _Nested("MessageEntity")
+    caption_entities = _Nested("MessageEntity")
+    photo = _Nested("PhotoSize")
+
+    def entity_text(self, entity: MessageEntity) -> Optional[str]:
+        """Text covered by entity (offsets are in UTF-16 code units)"""
+        text = self.text if self.text is not None else self.caption
+        if text is None:
+            return None
+        encoded = text.encode("utf-16-le")
+        return encoded[entity.offset * 2:(entity.offset + entity.length) * 2].decode("utf-16-le")
+
+
+class CallbackQuery(Model):
+    __slots__ = (
+        "id", "inline_message_id", "chat_instance", "data", "game_short_name",
+        "_from_user", "_message"
+    )
+    from_user = _Nested("User")
+    message = _Nested("Message")
+
+
+class Update(Model):
+    __slots__ = (
+        "update_id", "_message", "_edited_message", "_channel_post",
+        "_edited_channel_post", "_callback_query"
+    )
+    message = _Nested("Message")
+    edited_message = _Nested("Message")
+    channel_post = _Nested("Message")
+    edited_channel_post = _Nested("Message")
+    callback_query = _Nested("CallbackQuery")
+
+
+# Update type -> model of its payload, for typed handlers
+UPDATE_MODELS = {
+    "message": Message,
+    "edited_message": Message,
+    "channel_post": Message,
+    "edited_channel_post": Message,
+    "business_message": Message,
+    "edited_business_message": Message,
+    "callback_query": CallbackQuery
+}
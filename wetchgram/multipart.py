@@ -0,0 +1,166 @@
+import io
+import os
+import uuid
+from typing import Any, Callable, Dict, Iterator, Optional
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _Part:
+    """One file part: header, a source read in chunks, trailing CRLF"""
+
+    __slots__ = ("header", "source", "size")
+
+    def __init__(self, header: bytes, source: Any):
+        self.header = header
+        self.source = source
+        self.size = _source_size(source)
+
+
+class MultipartEncoder:
+    """Streaming multipart/form-data body.
+
+    Text fields are encoded up front (they are small); file sources are
+    read ``chunk_size`` bytes at a time while the body is sent, so a 50 MB
+    upload never sits in memory. Sources may be paths, file objects,
+    bytes/bytearray/memoryview (sliced without copying) or iterators of
+    bytes. With a known total size the encoder is a file-like object with
+    ``len()`` and is sent with Content-Length; with an iterator source the
+    size is unknown and ``chunks()`` is sent chunked instead.
+    """
+
+    def __init__(self,
+                 fields: Optional[Dict[str, str]],
+                 files: Dict[str, Any],
+                 chunk_size: int = CHUNK_SIZE,
+                 progress: Optional[Callable[[int, Optional[int]], None]] = None):
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.sent = 0
+
+        head = b"".join(
+            self._header(name) + b"\r\n" + _to_bytes(value) + b"\r\n"
+            for name, value in (fields or {}).items()
+        )
+        self._parts = [head]
+        for name, source in files.items():
+            filename = _filename(name, source)
+            header = self._header(name, filename) + b"Content-Type: application/octet-stream\r\n\r\n"
+            self._parts.append(_Part(header, source))
+            self._parts.append(b"\r\n")
+        self._parts.append(f"--{self.boundary}--\r\n".encode())
+
+        sizes = [len(p) if isinstance(p, bytes) else p.size for p in self._parts]
+        self.total = None if None in sizes else sum(sizes) + sum(
+            len(p.header) for p in self._parts if isinstance(p, _Part))
+        self._iter = None
+        self._buffer = b""
+
+    def _header(self, name: str, filename: Optional[str] = None) -> bytes:
+        disposition = f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        return (disposition + "\r\n").encode()
+
+    def __len__(self) -> int:
+        if self.total is None:
+            raise TypeError("multipart body with iterator source has no length")
+        return self.total
+
+    def chunks(self) -> Iterator[bytes]:
+        for part in self._parts:
+            if isinstance(part, bytes):
+                yield self._count(part)
+                continue
+            yield self._count(part.header)
+            for chunk in _read_source(part.source, self.chunk_size):
+                yield self._count(chunk)
+
+    def rewind(self):
+        """Start the body over for another attempt, file object sources from 0"""
+        self.sent = 0
+        self._iter = None
+        self._buffer = b""
+        for part in self._parts:
+            if isinstance(part, _Part) and hasattr(part.source, "seek") and hasattr(part.source, "read"):
+                try:
+                    part.source.seek(0)
+                except (OSError, ValueError):
+                    pass
+
+    def read(self, size: int = -1) -> bytes:
+        """File-like access for HTTP clients that stream bodies with read()"""
+        if self._iter is None:
+            self._iter = self.chunks()
+        if size is None or size < 0:
+            data = self._buffer + b"".join(self._iter)
+            self._buffer = b""
+            return data
+        while len(self._buffer) < size:
+            chunk = next(self._iter, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _count(self, chunk) -> bytes:
+        chunk = bytes(chunk)
+        self.sent += len(chunk)
+        if self.progress is not None and chunk:
+            self.progress(self.sent, self.total)
+        return chunk
+
+
+def _filename(field: str, source: Any) -> str:
+    if isinstance(source, str):
+        return os.path.basename(source)
+    name = getattr(source, "name", None)
+    if isinstance(name, str):
+        return os.path.basename(name)
+    return field
+
+
+def _source_size(source: Any) -> Optional[int]:
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    if isinstance(source, memoryview):
+        return source.nbytes
+    if hasattr(source, "read"):
+        try:
+            return os.fstat(source.fileno()).st_size - source.tell()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            pass
+        if hasattr(source, "getbuffer"):
+            return source.getbuffer().nbytes - source.tell()
+        try:
+            position = source.tell()
+            end = source.seek(0, os.SEEK_END)
+            source.seek(position)
+            return end - position
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            pass
+    return None
+
+
+def _read_source(source: Any, chunk_size: int) -> Iterator[bytes]:
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            yield from iter(lambda: f.read(chunk_size), b"")
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source).cast("B")
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+    elif hasattr(source, "read"):
+        yield from iter(lambda: source.read(chunk_size), b"")
+    else:
+        for chunk in source:
+            yield chunk
+
+
+def _to_bytes(value: Any) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode()
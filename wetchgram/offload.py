@@ -0,0 +1,157 @@
+import itertools
+import multiprocessing
+import re
+import struct
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Optional
+
+from .router import wants_args
+
+# Task id a pool process announces when it starts running the task
+_TASK = struct.Struct("<q")
+# Write end of the announcement pipe, set in each pool process
+_announce = None
+
+
+def _init_process(announce):
+    global _announce
+    _announce = announce
+
+
+def _run_task(task_id: int, func: Callable, payload: Any, args: tuple) -> Any:
+    # One small write per task is atomic, no lock shared with the parent
+    _announce.send_bytes(_TASK.pack(task_id))
+    return func(payload, *args)
+
+
+class CpuPool:
+    """Process pool for cpu_bound handlers.
+
+    Work runs outside this process, so it does not hold the GIL against
+    the other handlers. Pool processes are started with ``start_method``
+    (forkserver where available, else spawn), never forked from the
+    threaded bot, so handlers must be importable module-level functions
+    and the bot script has to start under ``if __name__ == "__main__":``.
+
+    A call's timeout counts from the moment a pool process starts it,
+    not while it waits for a free one. A call past its timeout cannot be
+    cancelled inside the pool: the pool's processes are killed, failing
+    whatever else was running there, and the next call starts a new
+    pool. A pool broken by a crashed process is replaced the same way.
+    """
+
+    def __init__(self, workers: Optional[int] = None, start_method: Optional[str] = None):
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.workers = workers
+        self.start_method = start_method
+        self._pool = None
+        self._announce = None
+        self._started = {}
+        self._ids = itertools.count()
+        self._lock = Lock()
+        self.calls = 0
+        self.timeouts = 0
+        self.broken = 0
+
+    def _get(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context(self.start_method)
+                reader, writer = context.Pipe(duplex=False)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                 initializer=_init_process, initargs=(writer,))
+                self._announce = writer
+                Thread(target=self._listen, args=(reader,), name="wetchgram-cpu-pool", daemon=True).start()
+            return self._pool
+
+    def _listen(self, reader):
+        while True:
+            try:
+                task_id = _TASK.unpack(reader.recv_bytes())[0]
+            except (EOFError, OSError):
+                return
+            if task_id < 0:
+                # Pool replaced
+                reader.close()
+                return
+            started = self._started.get(task_id)
+            if started is not None:
+                started.set()
+
+    def run(self, func: Callable, payload: Any, args: tuple, timeout: Optional[float]) -> Any:
+        task_id = next(self._ids)
+        started = self._started[task_id] = Event()
+        pool = None
+        try:
+            pool = self._get()
+            future = pool.submit(_run_task, task_id, func, payload, args)
+            self.calls += 1
+            if timeout is not None:
+                # Also wakes up when the task fails before it could start
+                future.add_done_callback(lambda _: started.set())
+                started.wait()
+            return future.result(timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            self._replace(pool, kill=True)
+            raise TimeoutError(f"{func.__name__} did not finish within {timeout}s, worker processes killed")
+        except BrokenProcessPool:
+            self.broken += 1
+            self._replace(pool)
+            raise
+        finally:
+            del self._started[task_id]
+
+    def _replace(self, pool: Optional[ProcessPoolExecutor], kill: bool = False, wait: bool = False):
+        with self._lock:
+            if pool is None or self._pool is not pool:
+                # Another failure already replaced it
+                return
+            self._pool = None
+            announce, self._announce = self._announce, None
+        announce.send_bytes(_TASK.pack(-1))
+        announce.close()
+        if kill:
+            terminate = getattr(pool, "terminate_workers", None)
+            if terminate is not None:
+                terminate()
+                return
+            # No public way to stop a running task before Python 3.14
+            for process in list((pool._processes or {}).values()):
+                process.terminate()
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+    def shutdown(self, wait: bool = False):
+        self._replace(self._pool, wait=wait)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "timeouts": self.timeouts, "broken": self.broken}
+
+
+class CpuBoundHandler:
+    """Route handler running func in the bot's CpuPool.
+
+    func gets the payload (a dict, or a model: both pickle as the plain
+    Bot API dict) and returns actions for this process to execute, see
+    Bot.apply_actions. A regex route's re.Match is passed as its groups(),
+    since matches cannot be pickled.
+    """
+
+    __slots__ = ("bot", "func", "timeout", "pass_args")
+
+    def __init__(self, bot, func: Callable, timeout: Optional[float] = None):
+        self.bot = bot
+        self.func = func
+        self.timeout = timeout
+        self.pass_args = wants_args(func)
+
+    def __call__(self, payload: Any, *args):
+        if self.pass_args:
+            args = tuple(arg.groups() if isinstance(arg, re.Match) else arg for arg in args)
+        else:
+            args = ()
+        result = self.bot.cpu_pool.run(self.func, payload, args, self.timeout)
+        self.bot.apply_actions(result)
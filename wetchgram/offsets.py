@@ -0,0 +1,197 @@
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import List, Tuple
+
+from .webhook import RecentIds
+
+
+class OffsetStore:
+    """Durable storage of the update offset and the updates in flight.
+
+    ``load`` returns (offset, updates taken in but not handled yet);
+    ``save`` records a new offset, journals ``added`` updates and forgets
+    the ``removed`` update_ids, and must make the result survive a crash.
+    """
+
+    def load(self) -> Tuple[int, List[dict]]:
+        raise NotImplementedError
+
+    def save(self, offset: int, added: List[dict], removed: List[int]):
+        raise NotImplementedError
+
+
+class FileOffsetStore(OffsetStore):
+    """JSON file, replaced atomically on every save"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pending = {}
+
+    def load(self) -> Tuple[int, List[dict]]:
+        if not os.path.exists(self.path):
+            return 0, []
+        with open(self.path, encoding="utf-8") as f:
+            state = json.load(f)
+        self._pending = {update["update_id"]: update for update in state.get("pending", [])}
+        return state.get("offset", 0), list(self._pending.values())
+
+    def save(self, offset: int, added: List[dict], removed: List[int]):
+        for update in added:
+            self._pending[update["update_id"]] = update
+        for update_id in removed:
+            self._pending.pop(update_id, None)
+        temp = self.path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump({"offset": offset, "pending": list(self._pending.values())}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+
+
+class SQLiteOffsetStore(OffsetStore):
+    """Rows per bot in an SQLite database, name tells bots sharing the file apart"""
+
+    def __init__(self, path: str, name: str = "default"):
+        self.name = name
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS offsets (name TEXT PRIMARY KEY, offset INTEGER, done TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS pending_updates "
+                         "(name TEXT, update_id INTEGER, payload TEXT, PRIMARY KEY (name, update_id))")
+        self._db.commit()
+        self._lock = Lock()
+
+    def load(self) -> Tuple[int, List[dict]]:
+        with self._lock:
+            row = self._db.execute("SELECT offset FROM offsets WHERE name = ?", (self.name,)).fetchone()
+            rows = self._db.execute("SELECT payload FROM pending_updates WHERE name = ? ORDER BY update_id",
+                                    (self.name,)).fetchall()
+        return (row[0] if row else 0), [json.loads(payload) for payload, in rows]
+
+    def save(self, offset: int, added: List[dict], removed: List[int]):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO offsets VALUES (?, ?, '[]')", (self.name, offset))
+            self._db.executemany("INSERT OR REPLACE INTO pending_updates VALUES (?, ?, ?)",
+                                 [(self.name, update["update_id"], json.dumps(update)) for update in added])
+            self._db.executemany("DELETE FROM pending_updates WHERE name = ? AND update_id = ?",
+                                 [(self.name, update_id) for update_id in removed])
+
+
+class OffsetTracker:
+    """Journals the updates in flight so the offset never waits for handlers.
+
+    ``begin`` takes an update in with its payload. Before the next
+    getUpdates confirms it to Telegram, ``poll_offset`` saves the new
+    updates to ``store`` together with the offset past them, so a slow
+    or hung handler holds only its own update, never intake. ``done``
+    drops an update from the journal; removals are saved at most every
+    ``commit_interval`` seconds or ``commit_every`` finished updates, so
+    fsync cost stays bounded. After a crash the updates still journaled
+    are handed back by ``replay`` and polling resumes after the last one
+    taken in: at most the updates finished since the last commit run
+    twice. ``begin`` also skips redeliveries (in flight or among the last
+    ``dedupe_size`` done).
+    """
+
+    def __init__(self,
+                 store: OffsetStore,
+                 commit_interval: float = 1.0,
+                 commit_every: int = 100,
+                 dedupe_size: int = 10000):
+        self.store = store
+        self.commit_interval = commit_interval
+        self.commit_every = commit_every
+        offset, pending = store.load()
+        # Offset saved with the journal, the one getUpdates may use
+        self.offset = offset
+        self._next = offset
+        self._inflight = {update["update_id"]: update for update in pending}
+        self._replay = list(pending)
+        # Journal changes since the last save
+        self._added = {}
+        self._removed = []
+        self.recent = RecentIds(dedupe_size)
+        self._lock = Lock()
+        self._commit_lock = Lock()
+        self._committed_at = time.monotonic()
+        self.skipped = 0
+        self.commits = 0
+        self.replayed = len(pending)
+
+    def replay(self) -> List[dict]:
+        """Updates journaled but not handled before the last run stopped, once"""
+        with self._lock:
+            pending, self._replay = self._replay, []
+        return pending
+
+    def begin(self, update: dict) -> bool:
+        """Journal update, False if it is in flight or already done"""
+        update_id = update["update_id"]
+        with self._lock:
+            if update_id in self._inflight or update_id in self.recent:
+                self.skipped += 1
+                return False
+            self._inflight[update_id] = update
+            self._added[update_id] = update
+            self._next = max(self._next, update_id + 1)
+            return True
+
+    def done(self, update_id: int):
+        with self._lock:
+            if self._inflight.pop(update_id, None) is None:
+                return
+            # Begun and done since the last save, the store never has to know
+            if self._added.pop(update_id, None) is None:
+                self._removed.append(update_id)
+            self.recent.add(update_id)
+        self.commit()
+
+    def poll_offset(self) -> int:
+        """Offset for the next getUpdates, saving the updates it confirms first.
+
+        While the save fails the old offset is returned: Telegram sends
+        those updates again and begin() skips them.
+        """
+        with self._lock:
+            unsaved = bool(self._added) or self._next != self.offset
+        if unsaved:
+            self.commit(force=True)
+        return self.offset
+
+    def commit(self, force: bool = False):
+        """Save the journal if commit_every or commit_interval is reached (always with force)"""
+        with self._lock:
+            changes = len(self._added) + len(self._removed)
+            due = changes >= self.commit_every or (
+                changes and time.monotonic() - self._committed_at >= self.commit_interval)
+            if not (due or force):
+                return
+        with self._commit_lock:
+            with self._lock:
+                offset, added, removed = self._next, self._added, self._removed
+                self._added, self._removed = {}, []
+                self._committed_at = time.monotonic()
+            try:
+                self.store.save(offset, list(added.values()), removed)
+            except Exception as e:
+                print(f"Offset commit error: {e}")
+                with self._lock:
+                    # Saved with the next commit; an update done meanwhile sits in both
+                    self._added = {**added, **self._added}
+                    self._removed = removed + self._removed
+                return
+            with self._lock:
+                self.offset = offset
+            self.commits += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "offset": self.offset,
+                "in_flight": len(self._inflight),
+                "replayed": self.replayed,
+                "skipped": self.skipped,
+                "commits": self.commits
+            }
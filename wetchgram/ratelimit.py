@@ -0,0 +1,140 @@
+import time
+from threading import Lock
+from typing import Any, Optional
+
+# Methods that post into a chat and count towards Telegram's per-chat limits
+MESSAGE_METHOD_PREFIXES = ("send", "copy", "forward", "edit")
+UNLIMITED_METHODS = {"getUpdates", "sendChatAction"}
+
+
+class TokenBucket:
+    """Token bucket stored as a single theoretical arrival time (GCRA).
+
+    ``ready_at`` tells when the next token is available, ``consume`` takes
+    it. Keeping one float per bucket makes per-chat buckets cheap.
+    """
+
+    __slots__ = ("interval", "tolerance", "tat")
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * (burst - 1)
+        self.tat = 0.0
+
+    def ready_at(self, now: float) -> float:
+        return max(now, self.tat - self.tolerance)
+
+    def consume(self, at: float):
+        self.tat = max(self.tat, at) + self.interval
+
+    def idle(self, now: float) -> bool:
+        return self.tat <= now
+
+
+class RateLimiter:
+    """Thread-safe limiter for Bot API calls.
+
+    Every call takes a token from the global bucket; calls that post into
+    a chat also take one from that chat's bucket (private chats have
+    positive ids, groups and channels negative). ``reserve_*`` book a
+    slot and return how long the caller has to wait for it, so the same
+    limiter serves threads and coroutines.
+    """
+
+    def __init__(self,
+                 global_rate: float = 30,
+                 private_rate: float = 1,
+                 group_rate: float = 20 / 60,
+                 global_burst: int = 1,
+                 private_burst: int = 1,
+                 group_burst: int = 1,
+                 max_idle_buckets: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_idle_buckets = max_idle_buckets
+        self._prune_at = max_idle_buckets
+        self.chats = {}
+        self._lock = Lock()
+        self.calls = 0
+        self.waits = {"global": 0, "chat": 0}
+        self.wait_time = {"global": 0.0, "chat": 0.0}
+        self.max_wait = 0.0
+
+    def reserve_chat(self, method: str, chat_id: Optional[Any]) -> float:
+        """Book a slot in the chat's bucket, return seconds to wait for it"""
+        if chat_id is None or method in UNLIMITED_METHODS or not method.startswith(MESSAGE_METHOD_PREFIXES):
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._chat_bucket(chat_id, now)
+            at = bucket.ready_at(now)
+            bucket.consume(at)
+            return self._record("chat", at - now)
+
+    def reserve_global(self, method: str) -> float:
+        """Book a slot in the global bucket, return seconds to wait for it"""
+        if method in UNLIMITED_METHODS:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            at = self.global_bucket.ready_at(now)
+            self.global_bucket.consume(at)
+            self.calls += 1
+            return self._record("global", at - now)
+
+    def acquire(self, method: str, chat_id: Optional[Any] = None) -> float:
+        """Block until the call may be sent, return seconds waited.
+
+        The chat slot is waited for first, so a chat that is over its limit
+        does not hold a global slot other chats could use meanwhile.
+        """
+        chat_delay = self.reserve_chat(method, chat_id)
+        if chat_delay > 0:
+            time.sleep(chat_delay)
+        global_delay = self.reserve_global(method)
+        if global_delay > 0:
+            time.sleep(global_delay)
+        return chat_delay + global_delay
+
+    def _record(self, scope: str, delay: float) -> float:
+        if delay > 0:
+            self.waits[scope] += 1
+            self.wait_time[scope] += delay
+            self.max_wait = max(self.max_wait, delay)
+        return max(delay, 0.0)
+
+    def _chat_bucket(self, chat_id, now: float) -> TokenBucket:
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            if len(self.chats) >= self._prune_at:
+                # A refilled bucket is the same as a new one, drop them
+                self.chats = {k: b for k, b in self.chats.items() if not b.idle(now)}
+                self._prune_at = max(self.max_idle_buckets, 2 * len(self.chats))
+            if _is_group(chat_id):
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.private_rate, self.private_burst)
+            self.chats[chat_id] = bucket
+        return bucket
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "global_waits": self.waits["global"],
+                "global_wait_time": self.wait_time["global"],
+                "chat_waits": self.waits["chat"],
+                "chat_wait_time": self.wait_time["chat"],
+                "max_wait": self.max_wait,
+                "tracked_chats": len(self.chats)
+            }
+
+
+def _is_group(chat_id) -> bool:
+    # Groups and channels have negative ids, @channelusername strings too
+    if isinstance(chat_id, str):
+        return chat_id.startswith("@") or chat_id.startswith("-")
+    return chat_id < 0
@@ -0,0 +1,115 @@
+import random
+import time
+from threading import Lock
+from typing import Any, Optional
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Methods that create something new, a blind retry may duplicate it
+NON_IDEMPOTENT_PREFIXES = ("send", "copy", "forward", "create", "export")
+
+# Errors raised before the request reached the server
+CONNECT_ERRORS = (requests.exceptions.ConnectTimeout,)
+# Errors of the transport, anything else was raised locally and is not retried
+NETWORK_ERRORS = (requests.RequestException,)
+if aiohttp is not None:
+    CONNECT_ERRORS += (aiohttp.ClientConnectorError,)
+    # aiohttp raises a bare TimeoutError when a ClientTimeout runs out
+    NETWORK_ERRORS += (aiohttp.ClientError, TimeoutError)
+
+
+class RetryPolicy:
+    """Central retry policy for Bot API calls.
+
+    * 429 is always retried after ``parameters.retry_after``; the wait is
+      applied to every later call for the same chat (or to all calls when
+      the request had no chat_id), so the flood wait is not prolonged.
+    * 5xx and network errors are retried with exponential backoff and
+      full jitter, but only for idempotent methods unless
+      ``retry_non_idempotent`` is set. A connect timeout never reached the
+      server, so it is always safe to retry. Errors raised locally, such
+      as an upload file that cannot be read, fail at once.
+    * No retry is started that would end after ``max_total`` seconds.
+    """
+
+    def __init__(self,
+                 max_retries: int = 3,
+                 backoff: float = 0.5,
+                 max_backoff: float = 30.0,
+                 max_total: float = 60.0,
+                 retry_non_idempotent: bool = False):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_total = max_total
+        self.retry_non_idempotent = retry_non_idempotent
+        self._blocked = {}
+        self._lock = Lock()
+        self.stats = {
+            "retries": 0,
+            "flood_waits": 0,
+            "server_errors": 0,
+            "network_errors": 0,
+            "gave_up": 0
+        }
+
+    def flood_delay(self, chat_id: Optional[Any] = None) -> float:
+        """Seconds left of a flood wait that applies to this call"""
+        if not self._blocked:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            until = max(self._blocked.get(None, 0.0), self._blocked.get(chat_id, 0.0))
+            if len(self._blocked) > 1000:
+                self._blocked = {k: v for k, v in self._blocked.items() if v > now}
+        return max(until - now, 0.0)
+
+    def retry_delay(self,
+                    method: str,
+                    chat_id: Optional[Any],
+                    attempt: int,
+                    started: float,
+                    status: Optional[int] = None,
+                    result: Optional[dict] = None,
+                    error: Optional[Exception] = None) -> Optional[float]:
+        """Seconds to wait before the next attempt, None to stop retrying"""
+        if error is not None and not isinstance(error, NETWORK_ERRORS):
+            if status is None or status < 500:
+                # Raised locally (reading an upload, a body that is not JSON)
+                return None
+            # A 5xx page that is not JSON is still a server error
+            error = None
+        if error is None and (status is None or status < 500) and status != 429:
+            return None
+
+        if status == 429:
+            retry_after = ((result or {}).get("parameters") or {}).get("retry_after", 1)
+            delay = float(retry_after)
+            reason = "flood_waits"
+            with self._lock:
+                until = time.monotonic() + delay
+                self._blocked[chat_id] = max(self._blocked.get(chat_id, 0.0), until)
+        else:
+            if not self._safe_to_retry(method, error):
+                return None
+            cap = min(self.max_backoff, self.backoff * (2 ** attempt))
+            delay = random.uniform(0, cap)
+            reason = "network_errors" if error is not None else "server_errors"
+
+        with self._lock:
+            self.stats[reason] += 1
+            if attempt >= self.max_retries or time.monotonic() - started + delay > self.max_total:
+                self.stats["gave_up"] += 1
+                return None
+            self.stats["retries"] += 1
+        return delay
+
+    def _safe_to_retry(self, method: str, error: Optional[Exception]) -> bool:
+        if self.retry_non_idempotent or not method.startswith(NON_IDEMPOTENT_PREFIXES):
+            return True
+        return isinstance(error, CONNECT_ERRORS)
@@ -0,0 +1,111 @@
+import inspect
+import re
+from typing import Any, Callable, Optional, Pattern, Tuple, Union
+
+# (handler, pass parsed args, model class the payload is wrapped in or None)
+Route = Tuple[Callable, bool, Optional[type]]
+
+
+def wants_args(handler: Callable) -> bool:
+    """True if handler requires a second positional parameter for parsed arguments.
+
+    Parameters with a default are left alone, so def start(message,
+    greeting="Hello") keeps its greeting.
+    """
+    try:
+        params = inspect.signature(handler).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    positional = 0
+    for param in params:
+        if param.kind == param.VAR_POSITIONAL:
+            return True
+        if param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD) and param.default is param.empty:
+            positional += 1
+    return positional >= 2
+
+
+class Router:
+    """Precompiled route table.
+
+    Lookup order is: exact string (one dict probe), longest registered
+    prefix (walk of a character trie, so cost depends on the text length,
+    not on the number of routes), then regex routes in registration order.
+    ``match`` returns ``(handler, args)`` where args is what the route
+    parsed: the remainder after a prefix or the re.Match of a pattern.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.prefixes = {}
+        self.patterns = []
+
+    def add(self, route: Union[str, Pattern], handler: Callable, prefix: bool = False,
+            model: Optional[type] = None):
+        entry = (handler, wants_args(handler), model)
+        if isinstance(route, re.Pattern):
+            self.patterns.append((route, entry))
+        elif prefix:
+            node = self.prefixes
+            for char in route:
+                node = node.setdefault(char, {})
+            node[None] = entry
+        else:
+            self.exact[route] = entry
+
+    def match(self, text: str) -> Optional[Tuple[Route, Any]]:
+        entry = self.exact.get(text)
+        if entry is not None:
+            return entry, None
+        entry = self.match_prefix(text)
+        if entry is not None:
+            return entry
+        return self.match_pattern(text)
+
+    def match_prefix(self, text: str) -> Optional[Tuple[Route, Any]]:
+        node = self.prefixes
+        found = None
+        for i, char in enumerate(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found = (node[None], i + 1)
+        if found is None:
+            return None
+        entry, end = found
+        return entry, text[end:]
+
+    def match_pattern(self, text: str) -> Optional[Tuple[Route, Any]]:
+        for pattern, entry in self.patterns:
+            m = pattern.match(text)
+            if m is not None:
+                return entry, m
+        return None
+
+    def __contains__(self, route) -> bool:
+        return route in self.exact
+
+    def __len__(self) -> int:
+        return len(self.exact) + len(self.patterns) + _count(self.prefixes)
+
+
+def _count(node: dict) -> int:
+    return sum(1 if key is None else _count(child) for key, child in node.items())
+
+
+def split_command(text: str, username: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Split '/cmd@BotName args' into ('/cmd', 'args').
+
+    None when the command is addressed to another bot.
+    """
+    parts = text.split(None, 1)
+    if not parts:
+        return None
+    command = parts[0]
+    rest = parts[1] if len(parts) > 1 else ""
+    if command.startswith("/") and "@" in command:
+        command, _, addressee = command.partition("@")
+        if username and addressee.lower() != username.lower():
+            return None
+    return command, rest
@@ -0,0 +1,346 @@
+import atexit
+import multiprocessing
+import signal
+import struct
+import time
+from collections import deque
+from multiprocessing.connection import Connection, wait
+from multiprocessing.reduction import recv_handle, send_handle
+from threading import Condition, Lock, Thread
+from typing import Callable, Optional
+
+from .coalesce import EditCoalescer
+from .dispatcher import Dispatcher, update_key
+from .filecache import FileIdCache
+from .offload import CpuPool
+
+# Acknowledgement of a handled update: its update_id
+_ACK = struct.Struct("<q")
+# Workers an update may be in flight in when they die before it is dropped
+MAX_ATTEMPTS = 2
+
+
+class _Worker:
+    __slots__ = ("index", "pid", "conn", "send_lock", "lock", "inflight", "restarts")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.pid = None
+        self.conn = None
+        self.send_lock = Lock()
+        # Guards inflight: update_id -> (encoded update, attempts)
+        self.lock = Lock()
+        self.inflight = {}
+        self.restarts = 0
+
+
+class Supervisor:
+    """Runs the handlers in ``processes`` forked worker processes.
+
+    The process that polls or serves the webhook only routes: an update
+    goes to the worker picked by hashing its chat (update_key), so a chat
+    always lands in the same process and per-chat state stays local
+    there. Inside a worker the bot's own Dispatcher keeps each chat in
+    order. Updates travel as the codec's JSON bytes over one pipe per
+    worker and come back acknowledged by update_id, which feeds
+    ``on_done`` and the ``max_pending`` limit.
+
+    Workers are forked by a forker process, itself forked by start()
+    before the supervisor starts its threads. A fork copies only the
+    forking thread, so a worker never inherits a lock some other thread
+    of this process was holding. A worker that dies is started again and
+    gets the updates it had not finished; an update that was in flight in
+    MAX_ATTEMPTS dead workers is dropped. Offers the Dispatcher interface
+    Bot's intake uses.
+    """
+
+    def __init__(self,
+                 bot,
+                 local: Dispatcher,
+                 processes: int = 4,
+                 max_pending: int = 10000,
+                 on_done: Optional[Callable[[dict], None]] = None):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("Worker processes need the fork start method, not available on this platform")
+        self.bot = bot
+        self.local = local
+        self.processes = processes
+        self.max_pending = max_pending
+        self.on_done = on_done
+        self._context = multiprocessing.get_context("fork")
+        self._workers = []
+        self._capacity = Condition()
+        self._pending = 0
+        self._running = False
+        self._forker = None
+        self._control = None
+        # Exit reports read while waiting for a spawn reply
+        self._exits = deque()
+        self._monitor = None
+        self.restarts = 0
+        self.lost = 0
+
+    def start(self):
+        with self._capacity:
+            if self._running:
+                return
+            self._running = True
+        control, child = self._context.Pipe()
+        # Not daemonic, neither are the workers: a worker's CpuPool starts processes of its own
+        self._forker = self._context.Process(target=_forker_main,
+                                             args=(self.bot, self.local, child, control, self.processes),
+                                             name="wetchgram-forker")
+        self._forker.start()
+        child.close()
+        self._control = control
+        for index in range(self.processes):
+            worker = _Worker(index)
+            self._spawn(worker)
+            self._workers.append(worker)
+        self._monitor = Thread(target=self._watch, name="wetchgram-supervisor", daemon=True)
+        self._monitor.start()
+        # Before multiprocessing joins the forker at exit, which would wait forever
+        atexit.register(self.stop)
+
+    def stop(self, timeout: float = 10.0):
+        """Close the pipes and give workers timeout seconds to finish what they have"""
+        with self._capacity:
+            if not self._running:
+                return
+            self._running = False
+        atexit.unregister(self.stop)
+        for worker in self._workers:
+            with worker.send_lock:
+                worker.conn.close()
+        try:
+            self._control.send(("stop", timeout))
+        except OSError:
+            # Forker already gone
+            pass
+        self._forker.join(timeout + 1.0)
+        if self._forker.is_alive():
+            self._forker.terminate()
+        self._control.close()
+        self._workers = []
+
+    def _spawn(self, worker: _Worker):
+        # Called before the worker is shared or with its send_lock held
+        self._control.send(("spawn", worker.index))
+        while True:
+            message = self._control.recv()
+            if message[0] == "spawned":
+                break
+            self._exits.append(message)
+        worker.pid = message[2]
+        worker.conn = Connection(recv_handle(self._control))
+
+    def submit(self, update: dict) -> bool:
+        """Send update to the worker process of its chat"""
+        worker = self._workers[hash(update_key(update)) % len(self._workers)]
+        data = self.bot.codec.dumps(update)
+        with self._capacity:
+            self._pending += 1
+        with worker.send_lock:
+            with worker.lock:
+                worker.inflight[update["update_id"]] = (data, 1)
+            try:
+                worker.conn.send_bytes(data)
+            except (OSError, ValueError):
+                # Worker is gone, its replacement gets the update from inflight
+                pass
+        return True
+
+    def wait_for_capacity(self, timeout: Optional[float] = None) -> bool:
+        """Block while max_pending updates are unacknowledged, False on timeout"""
+        with self._capacity:
+            return self._capacity.wait_for(lambda: self._pending < self.max_pending, timeout)
+
+    def _watch(self):
+        # Pipes of dead workers, at EOF until the forker reports the exit
+        closed = set()
+        while self._running:
+            while self._exits:
+                _, index, exitcode = self._exits.popleft()
+                self._restart(self._workers[index], exitcode)
+            conns = {worker.conn: worker for worker in self._workers if worker.conn not in closed}
+            try:
+                ready_list = wait(list(conns) + [self._control, self._forker.sentinel], timeout=1.0)
+            except (OSError, ValueError):
+                # Pipes closed by stop()
+                continue
+            for ready in ready_list:
+                if ready is self._forker.sentinel:
+                    if self._running:
+                        print(f"Forker process exited with {self._forker.exitcode}, "
+                              f"worker processes are no longer restarted")
+                    return
+                if ready is self._control:
+                    try:
+                        self._exits.append(self._control.recv())
+                    except (EOFError, OSError):
+                        pass
+                    continue
+                try:
+                    data = ready.recv_bytes()
+                except (EOFError, OSError):
+                    # Dead worker, the forker reports its exit
+                    closed.add(ready)
+                    continue
+                self._finish(conns[ready], _ACK.unpack(data)[0])
+
+    def _finish(self, worker: _Worker, update_id: int):
+        with worker.lock:
+            if worker.inflight.pop(update_id, None) is None:
+                return
+        with self._capacity:
+            self._pending -= 1
+            self._capacity.notify()
+        if self.on_done is not None:
+            # The parent no longer has the payload, the id is all on_done needs
+            self.on_done({"update_id": update_id})
+
+    def _restart(self, worker: _Worker, exitcode: int):
+        with worker.send_lock:
+            old = worker.conn
+            # Acknowledgements sent right before the crash still count
+            try:
+                while old.poll():
+                    self._finish(worker, _ACK.unpack(old.recv_bytes())[0])
+            except (EOFError, OSError):
+                pass
+            old.close()
+            print(f"Worker process {worker.index} exited with {exitcode}, restarting")
+            self._spawn(worker)
+            worker.restarts += 1
+            self.restarts += 1
+            resend, lost = [], []
+            with worker.lock:
+                for update_id, (data, attempts) in worker.inflight.items():
+                    if attempts >= MAX_ATTEMPTS:
+                        lost.append(update_id)
+                    else:
+                        worker.inflight[update_id] = (data, attempts + 1)
+                        resend.append(data)
+            for data in resend:
+                worker.conn.send_bytes(data)
+        for update_id in lost:
+            print(f"Dropping update {update_id}, it was in flight in {MAX_ATTEMPTS} crashed workers")
+            self.lost += 1
+            self._finish(worker, update_id)
+
+    def pending(self) -> int:
+        return self._pending
+
+    def stats(self) -> dict:
+        return {
+            "processes": len(self._workers),
+            "pending": self._pending,
+            "restarts": self.restarts,
+            "lost": self.lost,
+            "workers": [
+                {
+                    "pid": worker.pid,
+                    "in_flight": len(worker.inflight),
+                    "restarts": worker.restarts
+                } for worker in self._workers
+            ]
+        }
+
+
+def _forker_main(bot, dispatcher: Dispatcher, control, supervisor_end, processes: int):
+    """Fork a worker for each spawn request and report each exit, until stopped"""
+    # Inherited, it would keep control from ever seeing the supervisor go
+    supervisor_end.close()
+    # Ctrl-C reaches the whole process group, workers are stopped through stop()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    context = multiprocessing.get_context("fork")
+    children = {}
+    while True:
+        try:
+            for ready in wait(list(children) + [control]):
+                if ready is not control:
+                    index, process = children.pop(ready)
+                    process.join()
+                    control.send(("exit", index, process.exitcode))
+                    continue
+                message = control.recv()
+                if message[0] == "stop":
+                    _stop_children(children, message[1])
+                    return
+                parent, child = context.Pipe()
+                process = context.Process(target=_worker_main,
+                                          args=(bot, dispatcher, child, processes, [control, parent]),
+                                          name=f"wetchgram-process-{message[1]}")
+                process.start()
+                child.close()
+                control.send(("spawned", message[1], process.pid))
+                send_handle(control, parent.fileno(), None)
+                parent.close()
+                children[process.sentinel] = (message[1], process)
+        except (EOFError, OSError):
+            # Supervisor is gone, its end of every worker pipe closed with it
+            _stop_children(children, 10.0)
+            return
+
+
+def _stop_children(children: dict, timeout: float):
+    deadline = time.monotonic() + timeout
+    for _, process in children.values():
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+
+def _worker_main(bot, dispatcher: Dispatcher, conn, processes: int, foreign: list):
+    for other in foreign:
+        other.close()
+    # Sockets, threads, pools and SQLite connections of the parent are not
+    # usable after fork, every helper holding one is built again
+    bot.session = bot._create_session()
+    bot.download_pool = None
+    bot._download_workers = 0
+    if bot.edits is not None:
+        bot.edits = EditCoalescer(bot, bot.edits.window, bot.edits.workers, bot.edits.remember)
+    if bot.file_cache is not None:
+        cache = bot.file_cache
+        bot.file_cache = FileIdCache(cache.max_size, cache.path, cache.hash_content)
+    if bot.cpu_pool is not None:
+        bot.cpu_pool = CpuPool(bot.cpu_pool.workers)
+    bot.offsets = None
+    bot.dispatcher = dispatcher
+    if bot.rate_limiter is not None:
+        # A chat only ever talks from one process, the global limit is split
+        bucket = bot.rate_limiter.global_bucket
+        bucket.interval *= processes
+        bucket.tolerance *= processes
+
+    send_lock = Lock()
+
+    def acknowledge(update: dict):
+        try:
+            with send_lock:
+                conn.send_bytes(_ACK.pack(update["update_id"]))
+        except OSError:
+            # Supervisor stopped listening
+            pass
+
+    dispatcher.on_done = acknowledge
+    dispatcher.start()
+    loads = bot.codec.loads
+    while True:
+        try:
+            data = conn.recv_bytes()
+        except (EOFError, OSError):
+            break
+        update = loads(data)
+        dispatcher.wait_for_capacity()
+        if not dispatcher.submit(update):
+            acknowledge(update)
+    # Supervisor closed the pipe: finish what was handed over, then exit
+    while dispatcher.pending():
+        time.sleep(0.1)
+    dispatcher.stop()
+    if bot.cpu_pool is not None:
+        # A process exits without running atexit hooks, its pool would outlive it
+        bot.cpu_pool.shutdown(wait=True)
@@ -1,70 +1,214 @@
-class InlineKeyboardButton:
+import json
+from typing import Any, Tuple, Union
+
+
+def _dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _set(obj, **values):
+    for name, value in values.items():
+        object.__setattr__(obj, name, value)
+
+
+def _restore(cls, values: dict):
+    obj = object.__new__(cls)
+    _set(obj, **values)
+    return obj
+
+
+class _Frozen:
+    __slots__ = ()
+
+    def __reduce__(self):
+        # pickle and copy would restore slots through the blocked __setattr__
+        values = {}
+        for cls in type(self).__mro__:
+            for slot in cls.__dict__.get("__slots__", ()):
+                values[slot] = None if slot == "_json" else getattr(self, slot)
+        return _restore, (type(self), values)
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name: str):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+
+class InlineKeyboardButton(_Frozen):
+    __slots__ = ("text", "callback_data", "url", "_dict")
+
     def __init__(self, text: str, callback_data: str = None, url: str = None):
-        self.text = text
-        self.callback_data = callback_data
-        self.url = url
-    
+        data = {"text": text}
+        if callback_data:
+            data["callback_data"] = callback_data
+        if url:
+            data["url"] = url
+        _set(self, text=text, callback_data=callback_data, url=url, _dict=data)
+
+    def replace(self, **changes) -> "InlineKeyboardButton":
+        values = {"text": self.text, "callback_data": self.callback_data, "url": self.url}
+        values.update(changes)
+        return InlineKeyboardButton(**values)
+
     def to_dict(self) -> dict:
-        data = {"text": self.text}
-        if self.callback_data:
-            data["callback_data"] = self.callback_data
-        if self.url:
-            data["url"] = self.url
-        return data
+        return dict(self._dict)
+
+
+class ReplyKeyboardButton(_Frozen):
+    __slots__ = ("text", "_dict")
 
-class ReplyKeyboardButton:
     def __init__(self, text: str):
-        self.text = text
-    
+        _set(self, text=text, _dict={"text": text})
+
     def to_dict(self) -> dict:
-        return {"text": self.text}
+        return dict(self._dict)
+
+
+Rows = Tuple[Tuple[dict, ...], ...]
+
+
+class _Markup(_Frozen):
+    """Markup serialized once.
+
+    ``to_json()`` caches the encoded bytes, which Bot methods put into the
+    request body as they are. The first serialization freezes the markup:
+    ``add_row`` is for building at startup, afterwards ``with_button``,
+    ``with_row`` and ``without_row`` derive new markups that share every
+    unchanged row with this one.
+    """
+
+    __slots__ = ("_rows", "_json")
+    _field = ""
+
+    def _button(self, button: Any) -> dict:
+        raise NotImplementedError
+
+    def _options(self) -> dict:
+        return {}
 
-class InlineKeyboardMarkup:
-    def __init__(self, keyboard: list = None):
-        self.inline_keyboard = keyboard or []
-    
     def add_row(self, *buttons):
-        self.inline_keyboard.append([btn.to_dict() for btn in buttons])
-    
+        if self._json is not None:
+            raise TypeError(f"{type(self).__name__} is frozen once serialized, derive with with_row()")
+        _set(self, _rows=self._rows + (tuple(self._button(btn) for btn in buttons),))
+        return self
+
+    def with_button(self, row: int, column: int, button: Any):
+        """Copy with one button replaced"""
+        if row < 0:
+            row += len(self._rows)
+        buttons = list(self._rows[row])
+        buttons[column] = self._button(button)
+        return self._derive(self._rows[:row] + (tuple(buttons),) + self._rows[row + 1:])
+
+    def with_row(self, index: int, *buttons):
+        """Copy with row index replaced, index == len(markup) appends"""
+        row = (tuple(self._button(btn) for btn in buttons),)
+        if index < 0:
+            index += len(self._rows)
+        return self._derive(self._rows[:index] + row + self._rows[index + 1:])
+
+    def without_row(self, index: int):
+        if index < 0:
+            index += len(self._rows)
+        return self._derive(self._rows[:index] + self._rows[index + 1:])
+
+    def _derive(self, rows: Rows):
+        markup = object.__new__(type(self))
+        for cls in type(self).__mro__:
+            for slot in cls.__dict__.get("__slots__", ()):
+                _set(markup, **{slot: getattr(self, slot)})
+        _set(markup, _rows=rows, _json=None)
+        return markup
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
     def to_dict(self) -> dict:
-        return {"inline_keyboard": self.inline_keyboard}
+        data = {self._field: [[dict(btn) for btn in row] for row in self._rows]}
+        data.update(self._options())
+        return data
+
+    def to_json(self) -> bytes:
+        if self._json is None:
+            _set(self, _json=_dumps(self.to_dict()))
+        return self._json
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class InlineKeyboardMarkup(_Markup):
+    __slots__ = ()
+    _field = "inline_keyboard"
+
+    def __init__(self, keyboard: list = None):
+        _set(self, _rows=tuple(tuple(self._button(btn) for btn in row) for row in keyboard or ()), _json=None)
+
+    def _button(self, button: Union[InlineKeyboardButton, dict]) -> dict:
+        # Plain dicts may carry any button field (web_app, switch_inline_query, ...)
+        return button._dict if isinstance(button, InlineKeyboardButton) else dict(button)
+
+    @property
+    def inline_keyboard(self) -> Tuple[Tuple[dict, ...], ...]:
+        """Read-only copy of the rows, derive changes with with_row()"""
+        return tuple(tuple(dict(btn) for btn in row) for row in self._rows)
+
+
+class ReplyKeyboardMarkup(_Markup):
+    __slots__ = ("resize_keyboard",)
+    _field = "keyboard"
 
-class ReplyKeyboardMarkup:
     def __init__(self, resize_keyboard: bool = True):
-        self.keyboard = []
-        self.resize_keyboard = resize_keyboard
-    
-    def add_row(self, *buttons):
-        row = []
-        for btn in buttons:
-            if isinstance(btn, ReplyKeyboardButton):
-                row.append(btn.to_dict())
-            else:
-                row.append({"text": str(btn)})
-        self.keyboard.append(row)
-    
-    def to_dict(self) -> dict:
-        return {
-            "keyboard": self.keyboard,
-            "resize_keyboard": self.resize_keyboard
-        }
+        _set(self, _rows=(), _json=None, resize_keyboard=resize_keyboard)
+
+    def _button(self, button: Union[ReplyKeyboardButton, dict, str]) -> dict:
+        if isinstance(button, ReplyKeyboardButton):
+            return button._dict
+        if isinstance(button, dict):
+            return dict(button)
+        return {"text": str(button)}
+
+    def _options(self) -> dict:
+        return {"resize_keyboard": self.resize_keyboard}
+
+    @property
+    def keyboard(self) -> Tuple[Tuple[dict, ...], ...]:
+        """Read-only copy of the rows, derive changes with with_row()"""
+        return tuple(tuple(dict(btn) for btn in row) for row in self._rows)
+
+
+class ForceReply(_Frozen):
+    __slots__ = ("selective", "_json")
 
-class ForceReply:
     def __init__(self, selective: bool = False):
-        self.selective = selective
-    
+        _set(self, selective=selective, _json=None)
+
     def to_dict(self) -> dict:
         return {
             "force_reply": True,
             "selective": self.selective
         }
 
-class ReplyKeyboardRemove:
+    def to_json(self) -> bytes:
+        if self._json is None:
+            _set(self, _json=_dumps(self.to_dict()))
+        return self._json
+
+
+class ReplyKeyboardRemove(_Frozen):
+    __slots__ = ("selective", "_json")
+
     def __init__(self, selective: bool = False):
-        self.selective = selective
-    
+        _set(self, selective=selective, _json=None)
+
     def to_dict(self) -> dict:
         return {
             "remove_keyboard": True,
             "selective": self.selective
-        }
\ No newline at end of file
+        }
+
+    def to_json(self) -> bytes:
+        if self._json is None:
+            _set(self, _json=_dumps(self.to_dict()))
+        return self._json
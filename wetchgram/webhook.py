@@ -0,0 +1,119 @@
+import hmac
+import json
+import ssl
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from typing import Any, Callable, Optional
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Updates are a few KB, anything far larger is not from Telegram
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class RecentIds:
+    """Bounded window of recently seen update_ids, thread-safe"""
+
+    def __init__(self, size: int = 10000):
+        self.size = size
+        self._order = deque()
+        self._seen = set()
+        self._lock = Lock()
+
+    def add(self, update_id: int) -> bool:
+        """Remember update_id, False if it was already seen"""
+        with self._lock:
+            if update_id in self._seen:
+                return False
+            self._seen.add(update_id)
+            self._order.append(update_id)
+            if len(self._order) > self.size:
+                self._seen.discard(self._order.popleft())
+            return True
+
+    def __contains__(self, update_id: int) -> bool:
+        return update_id in self._seen
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """Lightweight HTTP server that receives Telegram webhook updates.
+
+    Each POST is parsed, checked against the secret token and redelivery
+    window, handed to ``on_update`` and acknowledged right away, so
+    handler time never counts against Telegram's delivery connections.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self,
+                 host: str,
+                 port: int,
+                 path: str,
+                 on_update: Callable[[dict], None],
+                 secret_token: Optional[str] = None,
+                 dedupe_size: int = 10000,
+                 certfile: Optional[str] = None,
+                 keyfile: Optional[str] = None,
+                 loads: Callable[[bytes], Any] = json.loads):
+        super().__init__((host, port), _WebhookHandler)
+        self.webhook_path = path
+        self.loads = loads
+        self.on_update = on_update
+        self.secret_token = secret_token
+        self.recent = RecentIds(dedupe_size)
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        # Rejected before the body is read, so the connection is not reusable
+        if self.path.split("?", 1)[0] != server.webhook_path:
+            return self._reject(404)
+        if server.secret_token is not None:
+            secret = self.headers.get(SECRET_HEADER, "").encode("latin-1")
+            if not hmac.compare_digest(secret, server.secret_token.encode()):
+                return self._reject(403)
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            return self._reject(400)
+        if length < 0:
+            return self._reject(400)
+        if length > MAX_BODY_SIZE:
+            return self._reject(413)
+        body = self.rfile.read(length)
+
+        try:
+            update = server.loads(body)
+            update_id = update["update_id"]
+        except (ValueError, KeyError, TypeError):
+            return self._reply(400)
+
+        self._reply(200)
+        if server.recent.add(update_id):
+            try:
+                server.on_update(update)
+            except Exception as e:
+                print(f"Webhook error: {e}")
+
+    def do_GET(self):
+        self._reply(405)
+
+    def _reject(self, status: int):
+        self.close_connection = True
+        self._reply(status)
+
+    def _reply(self, status: int):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()